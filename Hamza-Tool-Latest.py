@@ -1,9 +1,10 @@
-import pydicom
 import os
-import numpy as np
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from skimage.exposure import equalize_adapthist
+from enhancement import describe_method, list_dicom_files, process_files
+from job_server import DEFAULT_URL, get_job, submit_job
+from output_writer import OutputWriter
+from previews import PreviewWriter
 
 class DicomEnhancerGUI:
     def __init__(self, root):
@@ -12,7 +13,7 @@ class DicomEnhancerGUI:
         
         # Set window size and position
         window_width = 750
-        window_height = 650
+        window_height = 760
         screen_width = root.winfo_screenwidth()
         screen_height = root.winfo_screenheight()
         center_x = int(screen_width/2 - window_width/2)
@@ -108,6 +109,21 @@ class DicomEnhancerGUI:
         tk.Entry(output_folder_frame, textvariable=self.output_path_var, width=50).pack(side=tk.LEFT, padx=5)
         tk.Button(output_folder_frame, text="Browse", command=self.select_output_folder).pack(side=tk.LEFT)
 
+        # Optional QA previews written alongside the output
+        self.previews_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(input_frame, text="Write PNG thumbnails and before/after contact sheets (output/previews)",
+                      variable=self.previews_var).pack(anchor=tk.W)
+
+        # Optional submission to the shared local job server
+        server_frame = tk.LabelFrame(self.root, text="Job Server", pady=5, padx=10)
+        server_frame.pack(fill=tk.X, padx=20, pady=5)
+
+        self.use_server_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(server_frame, text="Submit to local job server instead of processing here",
+                      variable=self.use_server_var).pack(side=tk.LEFT)
+        self.server_url_var = tk.StringVar(value=DEFAULT_URL)
+        tk.Entry(server_frame, textvariable=self.server_url_var, width=25).pack(side=tk.LEFT, padx=5)
+
         # Process button
         process_button = tk.Button(self.root, text="Process Images", 
                                  command=self.process_images,
@@ -142,134 +158,12 @@ class DicomEnhancerGUI:
             'coef_b': float(self.coef_b_var.get()),
             'clip_limit': float(self.clip_limit_var.get()),
             'input_folder': self.input_path_var.get(),
-            'output_folder': self.output_path_var.get()
+            'output_folder': self.output_path_var.get(),
+            'previews': self.previews_var.get(),
+            'use_server': self.use_server_var.get(),
+            'server_url': self.server_url_var.get().rstrip("/")
         }
 
-    def normalize_for_clahe(self, pixel_array):
-        """
-        Normalize pixel array to [0, 1] range for CLAHE processing
-        Returns normalized array and scaling parameters for restoration
-        """
-        min_val = np.min(pixel_array)
-        max_val = np.max(pixel_array)
-        
-        # Avoid division by zero
-        if max_val == min_val:
-            return pixel_array.astype(np.float64), min_val, max_val
-        
-        normalized = (pixel_array.astype(np.float64) - min_val) / (max_val - min_val)
-        return normalized, min_val, max_val
-
-    def denormalize_from_clahe(self, normalized_array, min_val, max_val, original_dtype):
-        """
-        Convert normalized array back to original scale and data type
-        """
-        if max_val == min_val:
-            return normalized_array.astype(original_dtype)
-        
-        # Scale back to original range
-        scaled = normalized_array * (max_val - min_val) + min_val
-        
-        # Round to nearest integer and clip to valid range
-        scaled = np.round(scaled)
-        
-        # Get valid range for the data type
-        info = np.iinfo(original_dtype)
-        scaled = np.clip(scaled, info.min, info.max)
-        
-        return scaled.astype(original_dtype)
-
-    def apply_clahe(self, pixel_array, clip_limit):
-        """
-        Apply CLAHE to pixel array while preserving data type and range
-        """
-        original_dtype = pixel_array.dtype
-        
-        # Normalize to [0, 1] for CLAHE
-        normalized, min_val, max_val = self.normalize_for_clahe(pixel_array)
-        
-        # Apply CLAHE
-        enhanced_normalized = equalize_adapthist(normalized, clip_limit=clip_limit)
-        
-        # Convert back to original scale and data type
-        enhanced_pixels = self.denormalize_from_clahe(enhanced_normalized, min_val, max_val, original_dtype)
-        
-        return enhanced_pixels
-
-    def apply_linear_enhancement(self, pixel_array, coef_a, coef_b, ds):
-        """
-        Apply linear contrast enhancement while preserving DICOM properties
-        """
-        # Get original pixel data
-        original_pixels = pixel_array.astype(float)
-        
-        # Store original data type
-        original_dtype = pixel_array.dtype
-        
-        # Get image properties
-        if hasattr(ds, 'RescaleSlope'):
-            rescale_slope = float(ds.RescaleSlope)
-        else:
-            rescale_slope = 1.0
-            
-        if hasattr(ds, 'RescaleIntercept'):
-            rescale_intercept = float(ds.RescaleIntercept)
-        else:
-            rescale_intercept = 0.0
-            
-        # Convert stored pixels to actual HU values if needed
-        hu_values = original_pixels * rescale_slope + rescale_intercept
-        
-        # Apply contrast enhancement equation
-        enhanced_hu = coef_a * hu_values - coef_b
-        
-        # Convert back to stored pixel values
-        if rescale_slope != 1.0 or rescale_intercept != 0.0:
-            enhanced_pixels = (enhanced_hu - rescale_intercept) / rescale_slope
-        else:
-            enhanced_pixels = enhanced_hu
-            
-        # Round to nearest integer
-        enhanced_pixels = np.round(enhanced_pixels)
-        
-        # Clip to valid range for the data type
-        info = np.iinfo(original_dtype)
-        enhanced_pixels = np.clip(enhanced_pixels, info.min, info.max)
-        
-        # Convert back to original data type
-        enhanced_pixels = enhanced_pixels.astype(original_dtype)
-        
-        return enhanced_pixels
-
-    def enhance_contrast(self, ds, coef_a, coef_b, clip_limit, method):
-        """
-        Apply contrast enhancement based on selected method
-        """
-        original_pixels = ds.pixel_array
-        
-        if method == "linear_only":
-            enhanced_pixels = self.apply_linear_enhancement(original_pixels, coef_a, coef_b, ds)
-            
-        elif method == "clahe_only":
-            enhanced_pixels = self.apply_clahe(original_pixels, clip_limit)
-            
-        elif method == "linear_then_clahe":
-            # Apply linear enhancement first
-            linear_enhanced = self.apply_linear_enhancement(original_pixels, coef_a, coef_b, ds)
-            # Then apply CLAHE
-            enhanced_pixels = self.apply_clahe(linear_enhanced, clip_limit)
-            
-        elif method == "clahe_then_linear":
-            # Apply CLAHE first
-            clahe_enhanced = self.apply_clahe(original_pixels, clip_limit)
-            # Create a temporary dataset copy for linear enhancement
-            temp_ds = ds.copy()
-            temp_ds.PixelData = clahe_enhanced.tobytes()
-            # Then apply linear enhancement
-            enhanced_pixels = self.apply_linear_enhancement(clahe_enhanced, coef_a, coef_b, temp_ds)
-        
-        return enhanced_pixels
-
     def log_progress(self, message):
         self.progress_text.insert(tk.END, message + "\n")
         self.progress_text.see(tk.END)
@@ -301,81 +195,31 @@ class DicomEnhancerGUI:
             self.reset_progress()
             
             # Log processing parameters
-            if params['method'] == "linear_only":
-                self.log_progress(f"Using Linear Enhancement: y = {params['coef_a']}x - {params['coef_b']}")
-            elif params['method'] == "clahe_only":
-                self.log_progress(f"Using CLAHE with clip limit: {params['clip_limit']}")
-            elif params['method'] == "linear_then_clahe":
-                self.log_progress(f"Using Linear → CLAHE: y = {params['coef_a']}x - {params['coef_b']}, clip limit: {params['clip_limit']}")
-            elif params['method'] == "clahe_then_linear":
-                self.log_progress(f"Using CLAHE → Linear: clip limit: {params['clip_limit']}, y = {params['coef_a']}x - {params['coef_b']}")
+            self.log_progress(describe_method(params))
+
+            if params['use_server']:
+                self.submit_to_server(params)
+                return
             
-            dicom_files = [f for f in os.listdir(params['input_folder']) if f.endswith('.dcm')]
+            dicom_files = list_dicom_files(params['input_folder'])
             
             if not dicom_files:
                 self.log_progress("No DICOM files found in the input folder!")
                 return
 
-            total_files = len(dicom_files)
-            processed_files = 0
-
-            for filename in dicom_files:
-                try:
-                    input_path = os.path.join(params['input_folder'], filename)
-                    output_path = os.path.join(params['output_folder'], filename)
-                    
-                    # Read DICOM file
-                    ds = pydicom.dcmread(input_path)
-                    
-                    # Create a copy of the dataset to preserve all metadata
-                    ds_output = ds.copy()
-                    
-                    # Apply contrast enhancement based on selected method
-                    enhanced_pixels = self.enhance_contrast(ds, params['coef_a'], params['coef_b'], 
-                                                         params['clip_limit'], params['method'])
-                    
-                    # Update pixel data while preserving metadata
-                    ds_output.PixelData = enhanced_pixels.tobytes()
-                    
-                    # Preserve important DICOM tags
-                    ds_output.Rows = ds.Rows
-                    ds_output.Columns = ds.Columns
-                    ds_output.BitsAllocated = ds.BitsAllocated
-                    ds_output.BitsStored = ds.BitsStored
-                    ds_output.HighBit = ds.HighBit
-                    ds_output.PixelRepresentation = ds.PixelRepresentation
-                    ds_output.SamplesPerPixel = ds.SamplesPerPixel
-                    ds_output.PhotometricInterpretation = ds.PhotometricInterpretation
-                    
-                    # Add processing information
-                    ds_output.add_new(0x00071001, 'LO', 'Contrast enhanced')
-                    if params['method'] == "linear_only":
-                        ds_output.add_new(0x00071002, 'LO', f'Linear: y={params["coef_a"]}x-{params["coef_b"]}')
-                    elif params['method'] == "clahe_only":
-                        ds_output.add_new(0x00071002, 'LO', f'CLAHE: clip={params["clip_limit"]}')
-                    elif params['method'] == "linear_then_clahe":
-                        ds_output.add_new(0x00071002, 'LO', f'Linear then CLAHE: y={params["coef_a"]}x-{params["coef_b"]}, clip={params["clip_limit"]}')
-                    elif params['method'] == "clahe_then_linear":
-                        ds_output.add_new(0x00071002, 'LO', f'CLAHE then Linear: clip={params["clip_limit"]}, y={params["coef_a"]}x-{params["coef_b"]}')
-                    
-                    # Save processed image
-                    ds_output.save_as(output_path)
-                    
-                    processed_files += 1
-                    self.log_progress(f"Processed: {filename} ({processed_files}/{total_files})")
-                    
-                    # Debug information for first processed file
-                    if processed_files == 1:
-                        sample_coords = (min(100, ds.Rows-1), min(100, ds.Columns-1))
-                        original_val = ds.pixel_array[sample_coords]
-                        enhanced_val = enhanced_pixels[sample_coords]
-                        self.log_progress(f"\nDebug - Pixel at {sample_coords}:")
-                        self.log_progress(f"Original value: {original_val}")
-                        self.log_progress(f"Enhanced value: {enhanced_val}")
-                    
-                except Exception as e:
-                    self.log_progress(f"Error processing {filename}: {str(e)}")
-                    continue
+            previews = None
+            if params['previews']:
+                previews = PreviewWriter(os.path.join(params['output_folder'], "previews"))
+
+            writer = OutputWriter()
+            process_files(params, dicom_files, log=self.log_progress, previews=previews, writer=writer)
+            writer.close()
+
+            if previews is not None:
+                written, failed = previews.close()
+                for filename, error in failed.items():
+                    self.log_progress(f"Error writing preview for {filename}: {error}")
+                self.log_progress(f"Previews written: {written}")
 
             self.log_progress("\nProcessing completed!")
             messagebox.showinfo("Success", "Processing completed successfully!")
@@ -383,6 +227,37 @@ class DicomEnhancerGUI:
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
+    def submit_to_server(self, params):
+        """Hand the batch to the job server and follow its progress"""
+        if params['previews']:
+            self.log_progress("Previews are not written for jobs run by the job server")
+
+        job = submit_job(params, url=params['server_url'])
+        self.log_progress(f"Submitted job {job['id']} ({job['total']} files) to {params['server_url']}")
+        self.poll_job(job['id'], params['server_url'])
+
+    def poll_job(self, job_id, url, reported=-1):
+        """Log job server progress once a second until the job finishes"""
+        try:
+            job = get_job(job_id, url)
+        except Exception as e:
+            self.log_progress(f"Lost contact with the job server: {str(e)}")
+            return
+
+        done = job['processed'] + len(job['failed'])
+        if done != reported:
+            self.log_progress(f"Job {job_id}: {job['processed']}/{job['total']} processed, "
+                              f"{len(job['failed'])} failed ({job['files_per_second']:.1f} files/s)")
+
+        if job['status'] in ("completed", "failed", "cancelled"):
+            for filename, error in job['failed'].items():
+                self.log_progress(f"Error processing {filename}: {error}")
+            self.log_progress(f"\nJob {job['status']}!")
+            messagebox.showinfo("Job Server", f"Job {job_id} {job['status']}")
+            return
+
+        self.root.after(1000, self.poll_job, job_id, url, done)
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = DicomEnhancerGUI(root)
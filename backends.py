@@ -0,0 +1,165 @@
+"""
+Registry of interchangeable implementations for the enhancement operations,
+with a one-time autotune that picks the fastest correct one per kind of image
+"""
+import json
+import os
+import time
+import numpy as np
+
+DEFAULT_TUNING_FILE = os.path.join(os.path.expanduser("~"), ".dicom_enhancer", "backends.json")
+
+# operation -> list of backend entries, in order of default preference
+_backends = {}
+
+# Winners from the tuning file, keyed by tuning_key()
+_tuned = None
+_tuning_file = DEFAULT_TUNING_FILE
+
+
+def register_backend(operation, name, func, eligible=None, preferred=None, reference=False):
+    """
+    Add an implementation of operation
+    eligible(pixel_array) says whether it can run on an image at all,
+    preferred(pixel_array) whether to use it when no tuning result exists.
+    The reference backend defines the correct output for every other one.
+    """
+    _backends.setdefault(operation, []).append({
+        'name': name,
+        'func': func,
+        'eligible': eligible or (lambda pixel_array: True),
+        'preferred': preferred or (lambda pixel_array: False),
+        'reference': reference,
+    })
+
+
+def get_backend(operation, name):
+    for backend in _backends[operation]:
+        if backend['name'] == name:
+            return backend
+    raise KeyError(f"No backend '{name}' for {operation}")
+
+
+def reference_backend(operation):
+    return next(b for b in _backends[operation] if b['reference'])
+
+
+def shape_class(pixel_array):
+    """Coarse size bucket, since the fastest backend changes with image size"""
+    pixels = pixel_array.size
+    if pixels < 512 * 512:
+        return "small"
+    if pixels < 2048 * 2048:
+        return "medium"
+    return "large"
+
+
+def tuning_key(operation, pixel_array):
+    return f"{operation}|{pixel_array.dtype.str}|{pixel_array.ndim}d|{shape_class(pixel_array)}"
+
+
+def set_tuning_file(path):
+    """Use a different tuning file and reload it on next use"""
+    global _tuning_file, _tuned
+    _tuning_file = path
+    _tuned = None
+
+
+def load_tuning():
+    """
+    Winners from the tuning file, ignored if it was tuned on a machine with a
+    different number of cores
+    """
+    global _tuned
+    if _tuned is None:
+        _tuned = {}
+        try:
+            with open(_tuning_file) as f:
+                data = json.load(f)
+            if data.get('cpu_count') == os.cpu_count():
+                _tuned = data.get('winners', {})
+        except (OSError, ValueError):
+            pass
+    return _tuned
+
+
+def save_tuning():
+    os.makedirs(os.path.dirname(os.path.abspath(_tuning_file)), exist_ok=True)
+    temp_path = f"{_tuning_file}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({'cpu_count': os.cpu_count(), 'winners': load_tuning()}, f, indent=2)
+    os.replace(temp_path, _tuning_file)
+
+
+def select_backend(operation, pixel_array):
+    """
+    Function to run operation on pixel_array: the tuned winner if there is one,
+    otherwise the first preferred eligible backend, otherwise the reference
+    """
+    winner = load_tuning().get(tuning_key(operation, pixel_array))
+    if winner:
+        try:
+            backend = get_backend(operation, winner)
+            if backend['eligible'](pixel_array):
+                return backend['func']
+        except KeyError:
+            pass
+
+    for backend in _backends[operation]:
+        if backend['eligible'](pixel_array) and backend['preferred'](pixel_array):
+            return backend['func']
+
+    return reference_backend(operation)['func']
+
+
+def _best_time(func, args, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def autotune(operation, samples, repeats=3, log=print):
+    """
+    Benchmark every eligible backend of operation on sample argument tuples,
+    whose first element is the pixel array. A backend only wins if its output
+    is identical to the reference output. Winners are stored per tuning key.
+    """
+    tuned = load_tuning()
+    reference = reference_backend(operation)
+
+    # One sample per kind of image is enough
+    by_key = {}
+    for args in samples:
+        by_key.setdefault(tuning_key(operation, args[0]), args)
+
+    for key, args in by_key.items():
+        try:
+            expected = reference['func'](*args)
+        except Exception as e:
+            log(f"Autotune {key}: skipped, reference failed: {e}")
+            continue
+        timings = {}
+
+        for backend in _backends[operation]:
+            if not backend['eligible'](args[0]):
+                continue
+            if backend is not reference:
+                try:
+                    result = backend['func'](*args)
+                except Exception as e:
+                    log(f"Autotune {key}: {backend['name']} rejected, {e}")
+                    continue
+                if result.dtype != expected.dtype or not np.array_equal(result, expected):
+                    log(f"Autotune {key}: {backend['name']} rejected, output differs from reference")
+                    continue
+            timings[backend['name']] = _best_time(backend['func'], args, repeats)
+
+        tuned[key] = min(timings, key=timings.get)
+        summary = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+        log(f"Autotune {key}: {tuned[key]} ({summary})")
+
+    return tuned
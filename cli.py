@@ -0,0 +1,139 @@
+"""
+Command line batch processing without the GUI
+
+    python cli.py INPUT OUTPUT --method linear_only --coef-a 1.22 --coef-b 5
+    python cli.py INPUT OUTPUT --shard 0/4 --shard-by series
+    python cli.py INPUT OUTPUT --verify-shards 4
+"""
+import argparse
+import os
+import sys
+from backends import DEFAULT_TUNING_FILE, set_tuning_file
+from dedup_cache import EnhancementCache
+from enhancement import (METHODS, autotune_backends, describe_method, list_dicom_files,
+                         process_files)
+from output_writer import DURABILITY_MODES, OutputWriter, remove_stale_partials
+from previews import PreviewWriter
+from sharding import (SHARD_KEYS, clear_marker, parse_shard, select_shard_files,
+                      verify_shards, write_marker)
+
+
+def shard_spec(spec):
+    """argparse type for --shard, reporting a bad i/N as a usage error"""
+    try:
+        return parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DICOM contrast enhancement")
+    parser.add_argument("input_folder", help="Folder containing .dcm files")
+    parser.add_argument("output_folder", help="Folder for enhanced files")
+    parser.add_argument("--method", choices=METHODS, default="linear_only")
+    parser.add_argument("--coef-a", type=float, default=1.22, help="Coefficient (a) in y = ax - b")
+    parser.add_argument("--coef-b", type=float, default=5, help="Constant (b) in y = ax - b")
+    parser.add_argument("--clip-limit", type=float, default=0.01, help="CLAHE clip limit")
+    parser.add_argument("--compact", action="store_true",
+                        help="Store enhanced pixels in the fewest bits that hold their range")
+    parser.add_argument("--shard", metavar="i/N", type=shard_spec,
+                        help="Only process shard i of N (0-based), for running on several machines")
+    parser.add_argument("--shard-by", choices=SHARD_KEYS, default="series",
+                        help="Keep whole series, single instances or file names together")
+    parser.add_argument("--cache-dir",
+                        help="Reuse enhanced pixels for identical payloads, stored in this folder")
+    parser.add_argument("--cache-size-mb", type=int, default=2048,
+                        help="Evict least recently used cache entries above this size")
+    parser.add_argument("--previews", metavar="FOLDER",
+                        help="Write PNG thumbnails and per-series before/after contact sheets here")
+    parser.add_argument("--preview-size", type=int, default=256,
+                        help="Longest side of the thumbnails in pixels")
+    parser.add_argument("--autotune", action="store_true",
+                        help="Benchmark the enhancement backends on sample inputs before processing")
+    parser.add_argument("--autotune-samples", type=int, default=4,
+                        help="Number of input files to benchmark on")
+    parser.add_argument("--backend-cache", default=DEFAULT_TUNING_FILE,
+                        help="File storing the fastest backend per operation, dtype and size")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="fast",
+                        help="fast: no fsync; safe: fsync in batches before files appear")
+    parser.add_argument("--fsync-every", type=int, default=32,
+                        help="In safe mode, fsync after this many files or at each new series")
+    parser.add_argument("--writer-threads", type=int, default=2,
+                        help="Threads writing output files in the background")
+    parser.add_argument("--verify-shards", type=int, metavar="N",
+                        help="Check that all N shards of a job have completed and exit")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    params = {
+        'method': args.method,
+        'coef_a': args.coef_a,
+        'coef_b': args.coef_b,
+        'clip_limit': args.clip_limit,
+        'compact': args.compact,
+        'input_folder': args.input_folder,
+        'output_folder': args.output_folder
+    }
+
+    dicom_files = list_dicom_files(params['input_folder'])
+
+    if args.verify_shards is not None:
+        complete, problems = verify_shards(params['output_folder'], args.verify_shards, dicom_files)
+        for problem in problems:
+            print(problem)
+        print("All shards completed" if complete else "Job is not complete")
+        return 0 if complete else 1
+
+    # Several shards may create the shared output folder at the same time
+    os.makedirs(params['output_folder'], exist_ok=True)
+    remove_stale_partials(params['output_folder'])
+
+    print(describe_method(params))
+
+    if args.shard:
+        index, count = args.shard
+        clear_marker(params['output_folder'], index, count)
+        dicom_files = select_shard_files(params['input_folder'], dicom_files, index, count, args.shard_by)
+        print(f"Shard {index}/{count}: {len(dicom_files)} files")
+
+    if not dicom_files and not args.shard:
+        print("No DICOM files found in the input folder!")
+        return 0
+
+    set_tuning_file(args.backend_cache)
+    if args.autotune:
+        autotune_backends(params, dicom_files, args.autotune_samples)
+
+    cache = None
+    if args.cache_dir:
+        cache = EnhancementCache(args.cache_dir, args.cache_size_mb * 1024 * 1024)
+
+    previews = None
+    if args.previews:
+        previews = PreviewWriter(args.previews, args.preview_size)
+
+    writer = OutputWriter(args.writer_threads, args.durability, args.fsync_every)
+
+    processed, failed = process_files(params, dicom_files, cache=cache, previews=previews,
+                                      writer=writer)
+    writer.close()
+
+    if previews is not None:
+        written, preview_failed = previews.close()
+        for filename, error in preview_failed.items():
+            print(f"Error writing preview for {filename}: {error}")
+        print(f"Previews: {written} thumbnails written to {args.previews}")
+
+    if args.shard:
+        write_marker(params['output_folder'], index, count, args.shard_by, params,
+                     dicom_files, processed, failed)
+
+    print("\nProcessing completed!")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Compact output encoding: store enhanced pixels in the fewest bits that hold them
+
+When the dataset has an integer Modality LUT (RescaleSlope/RescaleIntercept)
+and it saves bits, the stored values are shifted so the minimum becomes 0 and
+RescaleIntercept absorbs the shift, so rescaled (HU) values stay exactly the same.
+"""
+import numpy as np
+from pydicom.valuerep import DSfloat
+
+# Attributes holding stored pixel values, shifted together with the pixels
+PADDING_ATTRIBUTES = ('PixelPaddingValue', 'PixelPaddingRangeLimit')
+
+# Stored value statistics of the input, no longer valid for the enhanced pixels
+STALE_ATTRIBUTES = ('SmallestImagePixelValue', 'LargestImagePixelValue')
+
+
+def bits_needed(low, high, signed):
+    """Smallest BitsStored that can hold every value in [low, high]"""
+    bits = 1
+    while True:
+        if signed:
+            fits = -(1 << (bits - 1)) <= low and high <= (1 << (bits - 1)) - 1
+        else:
+            fits = low >= 0 and high <= (1 << bits) - 1
+        if fits:
+            return bits
+        bits += 1
+
+
+def shifted_intercept(ds, offset):
+    """
+    RescaleIntercept after shifting stored values down by offset, or None when
+    the shift could change rescaled values (non-integer slope or intercept)
+    """
+    slope = float(ds.get('RescaleSlope', 1.0))
+    intercept = float(ds.RescaleIntercept)
+    if not (slope.is_integer() and intercept.is_integer()):
+        return None
+    return DSfloat(int(intercept + slope * offset), auto_format=True)
+
+
+def plan_encoding(ds, low, high):
+    """
+    (offset, bits_stored, bits_allocated, pixel_representation, intercept) for
+    stored values in [low, high]; intercept is None when it stays unchanged
+    """
+    padding = [int(ds.get(name)) for name in PADDING_ATTRIBUTES if name in ds]
+    low = min([low] + padding)
+    high = max([high] + padding)
+
+    def plan(offset, intercept):
+        pixel_representation = 1 if low - offset < 0 else 0
+        bits_stored = bits_needed(low - offset, high - offset, signed=bool(pixel_representation))
+        bits_allocated = 8 if bits_stored <= 8 else 16
+        return offset, bits_stored, bits_allocated, pixel_representation, intercept
+
+    best = plan(0, None)
+
+    # Shifting the minimum to 0 needs a Modality LUT to keep rescaled values
+    if 'RescaleIntercept' in ds and low != 0:
+        intercept = shifted_intercept(ds, low)
+        if intercept is not None:
+            shifted = plan(low, intercept)
+            if (shifted[2], shifted[1]) < (best[2], best[1]):
+                best = shifted
+
+    return best
+
+
+def compact_encode(ds_output, enhanced_pixels, low, high):
+    """
+    Re-encode ds_output's pixel data in the smallest valid representation
+    low and high are the minimum and maximum of enhanced_pixels
+    Returns the number of pixel data bytes saved
+    """
+    # Only single-sample images with 8 or 16 bits allocated are handled
+    if ds_output.get('SamplesPerPixel', 1) != 1 or enhanced_pixels.dtype.itemsize > 2:
+        return 0
+
+    offset, bits_stored, bits_allocated, pixel_representation, intercept = \
+        plan_encoding(ds_output, int(low), int(high))
+    if bits_allocated > enhanced_pixels.dtype.itemsize * 8:
+        return 0
+
+    dtype = np.dtype(f"{'i' if pixel_representation else 'u'}{bits_allocated // 8}")
+    if offset:
+        stored = (enhanced_pixels.astype(np.int32) - offset).astype(dtype)
+    else:
+        stored = enhanced_pixels.astype(dtype)
+
+    original_size = len(ds_output.PixelData)
+    pixel_data = stored.tobytes()
+    if len(pixel_data) % 2:
+        pixel_data += b'\x00'
+
+    ds_output.PixelData = pixel_data
+    ds_output['PixelData'].VR = 'OB' if bits_allocated == 8 else 'OW'
+    ds_output.BitsAllocated = bits_allocated
+    ds_output.BitsStored = bits_stored
+    ds_output.HighBit = bits_stored - 1
+    ds_output.PixelRepresentation = pixel_representation
+    if intercept is not None:
+        ds_output.RescaleIntercept = intercept
+
+    # Attributes in stored units follow the pixels, with the VR for the new signedness
+    vr = 'SS' if pixel_representation else 'US'
+    for name in PADDING_ATTRIBUTES:
+        if name in ds_output:
+            value = int(ds_output.get(name)) - offset
+            del ds_output[name]
+            setattr(ds_output, name, value)
+            ds_output[name].VR = vr
+    for name in STALE_ATTRIBUTES:
+        if name in ds_output:
+            del ds_output[name]
+
+    return original_size - len(pixel_data)
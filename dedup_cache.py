@@ -0,0 +1,150 @@
+"""
+Content-addressed cache of enhanced pixel data, shared within and across runs
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Bump when the enhancement algorithms change so old entries are never reused
+CACHE_VERSION = 1
+
+# Header attributes that change how the raw PixelData bytes decode or rescale
+KEY_ATTRIBUTES = (
+    'Rows', 'Columns', 'NumberOfFrames', 'SamplesPerPixel', 'BitsAllocated',
+    'BitsStored', 'HighBit', 'PixelRepresentation', 'PhotometricInterpretation',
+    'RescaleSlope', 'RescaleIntercept',
+)
+
+# Enhancement parameters that change the result
+KEY_PARAMS = ('method', 'coef_a', 'coef_b', 'clip_limit')
+
+
+class EnhancementCache:
+    """
+    On-disk store of enhanced pixel arrays keyed by a hash of the input payload
+    Once the total size exceeds max_bytes the least recently used entries are
+    evicted down to low_water of max_bytes, so eviction runs once per batch of
+    new entries rather than on every put. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, low_water=0.9):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # path -> size, least recently used first; only the startup scan walks the folder
+        self.index = OrderedDict((path, size) for _, path, size in sorted(self._entries()))
+        self.total_bytes = sum(self.index.values())
+        with self.lock:
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def key(self, ds, params):
+        """Hash of the raw PixelData, the rescale/layout tags and the method parameters"""
+        digest = hashlib.sha256()
+        digest.update(f"v{CACHE_VERSION}".encode())
+
+        transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', '')
+        digest.update(f"|{transfer_syntax}".encode())
+        for attribute in KEY_ATTRIBUTES:
+            digest.update(f"|{attribute}={ds.get(attribute, '')}".encode())
+        for name in KEY_PARAMS:
+            digest.update(f"|{name}={params[name]}".encode())
+
+        digest.update(b"|")
+        digest.update(ds.PixelData)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """Cached enhanced pixels for key, or None"""
+        path = self._path(key)
+        try:
+            pixels = np.load(path, allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # Mark as recently used for eviction, on disk for later runs as well
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            # Evicted by another thread or process since it was loaded
+            size = None
+
+        with self.lock:
+            self.hits += 1
+            if path in self.index:
+                self.index.move_to_end(path)
+            elif size is not None:
+                # Written by another process sharing the cache folder
+                self._add(path, size)
+        return pixels
+
+    def put(self, key, pixels):
+        """Store enhanced pixels for key and evict old entries if over budget"""
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write under a temporary name so concurrent readers never see partial files
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(pixels), allow_pickle=False)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self._add(path, os.path.getsize(path))
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self.total_bytes,
+                    'entries': len(self.index)}
+
+    def _add(self, path, size):
+        self.total_bytes += size - self.index.pop(path, 0)
+        self.index[path] = size
+
+    def _entries(self):
+        """(mtime, path, size) for every cached entry"""
+        entries = []
+        for directory, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith('.npy'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache is below its low water mark"""
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * self.low_water
+        while self.index and self.total_bytes > target:
+            path, size = self.index.popitem(last=False)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
@@ -0,0 +1,408 @@
+"""
+Headless DICOM contrast enhancement shared by the GUI and the command line tools
+"""
+import copy
+import pydicom
+import os
+import numpy as np
+from skimage.exposure import equalize_adapthist
+from compact_output import compact_encode
+from backends import autotune, register_backend, save_tuning, select_backend
+from output_writer import write_atomic
+from tiled_clahe import TILED_AVAILABLE, apply_clahe_tiled, use_tiled
+
+METHODS = ("linear_only", "clahe_only", "linear_then_clahe", "clahe_then_linear")
+
+
+def normalize_for_clahe(pixel_array):
+    """
+    Normalize pixel array to [0, 1] range for CLAHE processing
+    Returns normalized array and scaling parameters for restoration
+    """
+    min_val = np.min(pixel_array)
+    max_val = np.max(pixel_array)
+
+    # Avoid division by zero
+    if max_val == min_val:
+        return pixel_array.astype(np.float64), min_val, max_val
+
+    normalized = (pixel_array.astype(np.float64) - min_val) / (max_val - min_val)
+    return normalized, min_val, max_val
+
+
+def denormalize_from_clahe(normalized_array, min_val, max_val, original_dtype):
+    """
+    Convert normalized array back to original scale and data type
+    """
+    if max_val == min_val:
+        return normalized_array.astype(original_dtype)
+
+    # Scale back to original range
+    scaled = normalized_array * (max_val - min_val) + min_val
+
+    # Round to nearest integer and clip to valid range
+    scaled = np.round(scaled)
+
+    # Get valid range for the data type
+    info = np.iinfo(original_dtype)
+    scaled = np.clip(scaled, info.min, info.max)
+
+    return scaled.astype(original_dtype)
+
+
+def apply_clahe(pixel_array, clip_limit):
+    """
+    Apply CLAHE to pixel array while preserving data type and range
+    Runs on the fastest backend for this kind of image, see backends.py
+    """
+    return select_backend('clahe', pixel_array)(pixel_array, clip_limit)
+
+
+def clahe_reference(pixel_array, clip_limit):
+    """
+    CLAHE through skimage's equalize_adapthist, the reference for other backends
+    """
+    original_dtype = pixel_array.dtype
+
+    # Normalize to [0, 1] for CLAHE
+    normalized, min_val, max_val = normalize_for_clahe(pixel_array)
+
+    # Apply CLAHE
+    enhanced_normalized = equalize_adapthist(normalized, clip_limit=clip_limit)
+
+    # Convert back to original scale and data type
+    enhanced_pixels = denormalize_from_clahe(enhanced_normalized, min_val, max_val, original_dtype)
+
+    return enhanced_pixels
+
+
+if TILED_AVAILABLE:
+    register_backend('clahe', 'tiled', apply_clahe_tiled,
+                     eligible=lambda pixel_array: pixel_array.ndim == 2, preferred=use_tiled)
+register_backend('clahe', 'skimage', clahe_reference, reference=True)
+
+
+def get_rescale(ds):
+    """RescaleSlope and RescaleIntercept of a dataset, with their defaults"""
+    if hasattr(ds, 'RescaleSlope'):
+        rescale_slope = float(ds.RescaleSlope)
+    else:
+        rescale_slope = 1.0
+
+    if hasattr(ds, 'RescaleIntercept'):
+        rescale_intercept = float(ds.RescaleIntercept)
+    else:
+        rescale_intercept = 0.0
+
+    return rescale_slope, rescale_intercept
+
+
+def apply_linear_enhancement(pixel_array, coef_a, coef_b, ds):
+    """
+    Apply linear contrast enhancement while preserving DICOM properties
+    Runs on the fastest backend for this kind of image, see backends.py
+    """
+    return select_backend('linear', pixel_array)(pixel_array, coef_a, coef_b, ds)
+
+
+def linear_enhancement_reference(pixel_array, coef_a, coef_b, ds):
+    """
+    Straightforward linear enhancement, the reference for other backends
+    """
+    # Get original pixel data
+    original_pixels = pixel_array.astype(float)
+
+    # Store original data type
+    original_dtype = pixel_array.dtype
+
+    # Get image properties
+    rescale_slope, rescale_intercept = get_rescale(ds)
+
+    # Convert stored pixels to actual HU values if needed
+    hu_values = original_pixels * rescale_slope + rescale_intercept
+
+    # Apply contrast enhancement equation
+    enhanced_hu = coef_a * hu_values - coef_b
+
+    # Convert back to stored pixel values
+    if rescale_slope != 1.0 or rescale_intercept != 0.0:
+        enhanced_pixels = (enhanced_hu - rescale_intercept) / rescale_slope
+    else:
+        enhanced_pixels = enhanced_hu
+
+    # Round to nearest integer
+    enhanced_pixels = np.round(enhanced_pixels)
+
+    # Clip to valid range for the data type
+    info = np.iinfo(original_dtype)
+    enhanced_pixels = np.clip(enhanced_pixels, info.min, info.max)
+
+    # Convert back to original data type
+    enhanced_pixels = enhanced_pixels.astype(original_dtype)
+
+    return enhanced_pixels
+
+
+def linear_enhancement_fused(pixel_array, coef_a, coef_b, ds):
+    """
+    Same arithmetic as linear_enhancement_reference, in place on one float buffer
+    """
+    rescale_slope, rescale_intercept = get_rescale(ds)
+    info = np.iinfo(pixel_array.dtype)
+
+    values = pixel_array.astype(np.float64)
+    values *= rescale_slope
+    values += rescale_intercept
+    values *= coef_a
+    values -= coef_b
+    if rescale_slope != 1.0 or rescale_intercept != 0.0:
+        values -= rescale_intercept
+        values /= rescale_slope
+    np.round(values, out=values)
+    np.clip(values, info.min, info.max, out=values)
+
+    return values.astype(pixel_array.dtype)
+
+
+# Lookup tables by (dtype, coef_a, coef_b, slope, intercept), kept for the next file
+_linear_luts = {}
+MAX_LINEAR_LUTS = 8
+
+
+def linear_lut_eligible(pixel_array):
+    return pixel_array.dtype.kind in 'iu' and pixel_array.dtype.itemsize <= 2
+
+
+def linear_enhancement_lut(pixel_array, coef_a, coef_b, ds):
+    """
+    Linear enhancement for 8/16-bit images through a table of every possible
+    stored value, computed once with the reference implementation
+    """
+    dtype = pixel_array.dtype
+    index_dtype = np.dtype(f'u{dtype.itemsize}')
+    key = (dtype.str, coef_a, coef_b) + get_rescale(ds)
+
+    lut = _linear_luts.get(key)
+    if lut is None:
+        # Entry i holds the result for the stored value whose bits read as i unsigned
+        all_values = np.arange(np.iinfo(index_dtype).max + 1, dtype=index_dtype).view(dtype)
+        lut = linear_enhancement_reference(all_values, coef_a, coef_b, ds)
+        if len(_linear_luts) >= MAX_LINEAR_LUTS:
+            _linear_luts.clear()
+        _linear_luts[key] = lut
+
+    return lut[pixel_array.view(index_dtype)]
+
+
+register_backend('linear', 'lut', linear_enhancement_lut, eligible=linear_lut_eligible,
+                 preferred=lambda pixel_array: pixel_array.size >= 256 * 256)
+register_backend('linear', 'fused', linear_enhancement_fused,
+                 eligible=lambda pixel_array: pixel_array.dtype.kind in 'iu',
+                 preferred=lambda pixel_array: True)
+register_backend('linear', 'reference', linear_enhancement_reference, reference=True)
+
+
+def enhance_contrast(ds, coef_a, coef_b, clip_limit, method):
+    """
+    Apply contrast enhancement based on selected method
+    """
+    original_pixels = ds.pixel_array
+
+    if method == "linear_only":
+        enhanced_pixels = apply_linear_enhancement(original_pixels, coef_a, coef_b, ds)
+
+    elif method == "clahe_only":
+        enhanced_pixels = apply_clahe(original_pixels, clip_limit)
+
+    elif method == "linear_then_clahe":
+        # Apply linear enhancement first
+        linear_enhanced = apply_linear_enhancement(original_pixels, coef_a, coef_b, ds)
+        # Then apply CLAHE
+        enhanced_pixels = apply_clahe(linear_enhanced, clip_limit)
+
+    elif method == "clahe_then_linear":
+        # Apply CLAHE first
+        clahe_enhanced = apply_clahe(original_pixels, clip_limit)
+        # Then apply linear enhancement, which only reads the rescale tags from ds
+        enhanced_pixels = apply_linear_enhancement(clahe_enhanced, coef_a, coef_b, ds)
+
+    else:
+        raise ValueError(f"Unknown enhancement method: {method}")
+
+    return enhanced_pixels
+
+
+def describe_method(params):
+    """Human readable summary of the processing parameters for the log"""
+    if params['method'] == "linear_only":
+        return f"Using Linear Enhancement: y = {params['coef_a']}x - {params['coef_b']}"
+    elif params['method'] == "clahe_only":
+        return f"Using CLAHE with clip limit: {params['clip_limit']}"
+    elif params['method'] == "linear_then_clahe":
+        return f"Using Linear → CLAHE: y = {params['coef_a']}x - {params['coef_b']}, clip limit: {params['clip_limit']}"
+    elif params['method'] == "clahe_then_linear":
+        return f"Using CLAHE → Linear: clip limit: {params['clip_limit']}, y = {params['coef_a']}x - {params['coef_b']}"
+    raise ValueError(f"Unknown enhancement method: {params['method']}")
+
+
+def method_tag(params):
+    """Value stored in the private processing tag 0x00071002"""
+    if params['method'] == "linear_only":
+        return f'Linear: y={params["coef_a"]}x-{params["coef_b"]}'
+    elif params['method'] == "clahe_only":
+        return f'CLAHE: clip={params["clip_limit"]}'
+    elif params['method'] == "linear_then_clahe":
+        return f'Linear then CLAHE: y={params["coef_a"]}x-{params["coef_b"]}, clip={params["clip_limit"]}'
+    elif params['method'] == "clahe_then_linear":
+        return f'CLAHE then Linear: clip={params["clip_limit"]}, y={params["coef_a"]}x-{params["coef_b"]}'
+    raise ValueError(f"Unknown enhancement method: {params['method']}")
+
+
+def build_output_dataset(ds, enhanced_pixels, params):
+    """
+    Copy the input dataset and replace its pixel data with the enhanced pixels
+    """
+    # Create a copy of the dataset to preserve all metadata. Dataset.copy() is
+    # shallow and shares the data elements, so a deep copy keeps ds intact
+    ds_output = copy.deepcopy(ds)
+
+    # Update pixel data while preserving metadata
+    ds_output.PixelData = enhanced_pixels.tobytes()
+
+    # Preserve important DICOM tags
+    ds_output.Rows = ds.Rows
+    ds_output.Columns = ds.Columns
+    ds_output.BitsAllocated = ds.BitsAllocated
+    ds_output.BitsStored = ds.BitsStored
+    ds_output.HighBit = ds.HighBit
+    ds_output.PixelRepresentation = ds.PixelRepresentation
+    ds_output.SamplesPerPixel = ds.SamplesPerPixel
+    ds_output.PhotometricInterpretation = ds.PhotometricInterpretation
+
+    # Add processing information
+    ds_output.add_new(0x00071001, 'LO', 'Contrast enhanced')
+    ds_output.add_new(0x00071002, 'LO', method_tag(params))
+
+    # Optionally store the pixels in the fewest bits that hold the enhanced range
+    if params.get('compact'):
+        compact_encode(ds_output, enhanced_pixels, np.min(enhanced_pixels), np.max(enhanced_pixels))
+
+    return ds_output
+
+
+def list_dicom_files(input_folder):
+    """Sorted list of the .dcm file names directly inside input_folder"""
+    return sorted(f for f in os.listdir(input_folder) if f.endswith('.dcm'))
+
+
+def autotune_backends(params, dicom_files, samples=4, log=print):
+    """
+    Benchmark the backends of the operations used by params['method'] on a
+    few evenly spaced input files and save the winners to the tuning file
+    """
+    step = max(1, len(dicom_files) // samples)
+    linear_samples = []
+    clahe_samples = []
+
+    for filename in dicom_files[::step][:samples]:
+        try:
+            ds = pydicom.dcmread(os.path.join(params['input_folder'], filename))
+            pixel_array = ds.pixel_array
+        except Exception as e:
+            log(f"Autotune: cannot read {filename}: {str(e)}")
+            continue
+        linear_samples.append((pixel_array, params['coef_a'], params['coef_b'], ds))
+        clahe_samples.append((pixel_array, params['clip_limit']))
+
+    if 'linear' in params['method']:
+        autotune('linear', linear_samples, log=log)
+    if 'clahe' in params['method']:
+        autotune('clahe', clahe_samples, log=log)
+
+    save_tuning()
+
+
+def process_file(params, filename, cache=None, previews=None, writer=None):
+    """
+    Enhance one file from params['input_folder'] into params['output_folder']
+    With an OutputWriter the file is written in the background, otherwise
+    it is written synchronously and renamed into place
+    Returns the input dataset and the enhanced pixels
+    """
+    input_path = os.path.join(params['input_folder'], filename)
+    output_path = os.path.join(params['output_folder'], filename)
+
+    # Read DICOM file
+    ds = pydicom.dcmread(input_path)
+
+    # Reuse the result for a payload that was already enhanced
+    enhanced_pixels = None
+    if cache is not None:
+        cache_key = cache.key(ds, params)
+        enhanced_pixels = cache.get(cache_key)
+
+    if enhanced_pixels is None:
+        # Apply contrast enhancement based on selected method
+        enhanced_pixels = enhance_contrast(ds, params['coef_a'], params['coef_b'],
+                                           params['clip_limit'], params['method'])
+        if cache is not None:
+            cache.put(cache_key, enhanced_pixels)
+
+    # Save processed image
+    ds_output = build_output_dataset(ds, enhanced_pixels, params)
+    if writer is not None:
+        writer.write(ds_output, output_path, group=ds.get('SeriesInstanceUID'))
+    else:
+        write_atomic(ds_output, output_path)
+
+    if previews is not None:
+        previews.add(filename, ds, ds.pixel_array, enhanced_pixels)
+
+    return ds, enhanced_pixels
+
+
+def process_files(params, dicom_files, log=print, cache=None, previews=None, writer=None):
+    """
+    Enhance the given files from params['input_folder'] into params['output_folder']
+    An optional EnhancementCache reuses results for identical pixel payloads,
+    an optional PreviewWriter receives every original/enhanced pair and an
+    optional OutputWriter writes the results in the background
+    Returns the list of processed file names and a dict of failures
+    """
+    total_files = len(dicom_files)
+    processed = []
+    failed = {}
+
+    for filename in dicom_files:
+        try:
+            ds, enhanced_pixels = process_file(params, filename, cache, previews, writer)
+
+            processed.append(filename)
+            log(f"Processed: {filename} ({len(processed)}/{total_files})")
+
+            # Debug information for first processed file
+            if len(processed) == 1:
+                sample_coords = (min(100, ds.Rows-1), min(100, ds.Columns-1))
+                original_val = ds.pixel_array[sample_coords]
+                enhanced_val = enhanced_pixels[sample_coords]
+                log(f"\nDebug - Pixel at {sample_coords}:")
+                log(f"Original value: {original_val}")
+                log(f"Enhanced value: {enhanced_val}")
+
+        except Exception as e:
+            failed[filename] = str(e)
+            log(f"Error processing {filename}: {str(e)}")
+            continue
+
+    # Files only count as processed once they are on disk
+    if writer is not None:
+        for filename, error in writer.flush().items():
+            if filename in processed:
+                processed.remove(filename)
+            failed[filename] = error
+            log(f"Error writing {filename}: {error}")
+
+    if cache is not None:
+        log(f"Cache: {cache.hits} reused, {cache.misses} computed")
+
+    return processed, failed
@@ -0,0 +1,428 @@
+"""
+Local job queue service, so everyone on one machine shares a single worker pool
+
+    python job_server.py serve --port 8765 --workers 4
+    python job_server.py submit INPUT OUTPUT --method clahe_only --priority 5
+    python job_server.py status [JOB_ID]
+    python job_server.py cancel JOB_ID
+
+HTTP/JSON API:
+    POST   /jobs        submit a job, returns the job with its "id"
+    GET    /jobs        all jobs
+    GET    /jobs/<id>   one job with progress and throughput
+    DELETE /jobs/<id>   cancel a job, files already being processed still finish
+    GET    /stats       worker pool status and overall throughput
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from enhancement import METHODS, describe_method, list_dicom_files, process_file
+from output_writer import remove_stale_partials
+
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+
+# Job parameters and their defaults, matching the GUI
+JOB_DEFAULTS = {
+    'method': "linear_only",
+    'coef_a': 1.22,
+    'coef_b': 5.0,
+    'clip_limit': 0.01,
+    'compact': False,
+}
+
+
+def parse_flag(value, name):
+    """JSON boolean or a true/false string, as in the image server's query parameters"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        if value.lower() in ("1", "true", "yes"):
+            return True
+        if value.lower() in ("0", "false", "no", ""):
+            return False
+    raise ValueError(f"{name} must be true or false, got {value!r}")
+
+
+class Job:
+    def __init__(self, job_id, seq, params, dicom_files, priority, max_concurrency):
+        self.id = job_id
+        self.seq = seq
+        self.params = params
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.pending = deque(dicom_files)
+        self.total = len(dicom_files)
+        self.running = 0
+        self.processed = 0
+        self.failed = {}
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'max_concurrency': self.max_concurrency,
+            'method': self.params['method'],
+            'coef_a': self.params['coef_a'],
+            'coef_b': self.params['coef_b'],
+            'clip_limit': self.params['clip_limit'],
+            'compact': self.params['compact'],
+            'input_folder': self.params['input_folder'],
+            'output_folder': self.params['output_folder'],
+            'total': self.total,
+            'processed': self.processed,
+            'failed': self.failed,
+            'running': self.running,
+            'progress': (self.processed + len(self.failed)) / self.total if self.total else 1.0,
+            'files_per_second': self.processed / elapsed if elapsed else 0.0,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Priority scheduling of files from all jobs onto one pool of worker threads
+    Higher priority jobs go first, equal priorities in submission order, and a
+    job never has more than its max_concurrency files in progress
+    """
+
+    def __init__(self, workers=None, log=print):
+        self.workers = workers or os.cpu_count() or 1
+        self.log = log
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.seq = itertools.count(1)
+        self.started_at = time.time()
+        self.completed_files = 0
+        self.recent = deque()
+        self.busy = 0
+        self.stopping = False
+        self.threads = [threading.Thread(target=self._worker, daemon=True)
+                        for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, request):
+        """Validate a job request dict and queue it, returns the Job"""
+        if not isinstance(request, dict):
+            raise ValueError("Job request must be a JSON object")
+
+        params = dict(JOB_DEFAULTS)
+        for key in JOB_DEFAULTS:
+            if request.get(key) is not None:
+                params[key] = request[key]
+        params['input_folder'] = request.get('input_folder') or ""
+        params['output_folder'] = request.get('output_folder') or ""
+
+        if params['method'] not in METHODS:
+            raise ValueError(f"Unknown enhancement method: {params['method']}")
+        for key in ('coef_a', 'coef_b', 'clip_limit'):
+            params[key] = float(params[key])
+        params['compact'] = parse_flag(params['compact'], 'compact')
+        if not os.path.isdir(params['input_folder']):
+            raise ValueError(f"Input folder not found: {params['input_folder']}")
+        if not params['output_folder']:
+            raise ValueError("Output folder is required")
+
+        priority = int(request.get('priority') or 0)
+        max_concurrency = int(request.get('max_concurrency') or self.workers)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        try:
+            os.makedirs(params['output_folder'], exist_ok=True)
+        except OSError as e:
+            raise ValueError(f"Cannot create output folder {params['output_folder']}: {e.strerror}")
+        remove_stale_partials(params['output_folder'])
+        dicom_files = list_dicom_files(params['input_folder'])
+
+        with self.condition:
+            seq = next(self.seq)
+            job = Job(str(seq), seq, params, dicom_files, priority, max_concurrency)
+            self.jobs[job.id] = job
+            if not dicom_files:
+                job.status = "completed"
+                job.started_at = job.finished_at = time.time()
+            self.condition.notify_all()
+
+        self.log(f"Job {job.id} queued: {len(dicom_files)} files, priority {priority}, "
+                 f"{describe_method(params)}")
+        return job
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs[job_id]
+            if job.status in ("queued", "running"):
+                job.pending.clear()
+                job.status = "cancelled"
+                if job.running == 0:
+                    job.finished_at = time.time()
+            return job
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs[job_id].to_dict()
+
+    def list(self):
+        with self.condition:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def stats(self):
+        with self.condition:
+            now = time.time()
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+            return {
+                'workers': self.workers,
+                'busy_workers': self.busy,
+                'queued_jobs': sum(job.status == "queued" for job in self.jobs.values()),
+                'running_jobs': sum(job.status == "running" for job in self.jobs.values()),
+                'queued_files': sum(len(job.pending) for job in self.jobs.values()),
+                'completed_files': self.completed_files,
+                'files_per_second': len(self.recent) / min(60.0, max(now - self.started_at, 1e-9)),
+                'uptime': now - self.started_at,
+            }
+
+    def _next_task(self):
+        """Highest priority job with pending files and a free concurrency slot"""
+        candidates = [job for job in self.jobs.values()
+                      if job.pending and job.running < job.max_concurrency]
+        if not candidates:
+            return None
+
+        job = max(candidates, key=lambda job: (job.priority, -job.seq))
+        if job.status == "queued":
+            job.status = "running"
+            job.started_at = time.time()
+        job.running += 1
+        self.busy += 1
+        return job, job.pending.popleft()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                task = self._next_task()
+                while task is None and not self.stopping:
+                    self.condition.wait()
+                    task = self._next_task()
+                if task is None:
+                    return
+
+            job, filename = task
+            error = None
+            try:
+                process_file(job.params, filename)
+            except Exception as e:
+                error = str(e)
+
+            with self.condition:
+                job.running -= 1
+                self.busy -= 1
+                if error is None:
+                    job.processed += 1
+                    self.completed_files += 1
+                    self.recent.append(time.time())
+                    while self.recent[0] < self.recent[-1] - 60:
+                        self.recent.popleft()
+                else:
+                    job.failed[filename] = error
+
+                if not job.pending and job.running == 0 and job.finished_at is None:
+                    job.finished_at = time.time()
+                    if job.status == "running":
+                        job.status = "failed" if job.failed and not job.processed else "completed"
+                    self.log(f"Job {job.id} {job.status}: {job.processed} processed, "
+                             f"{len(job.failed)} failed")
+
+                # A concurrency slot was freed
+                self.condition.notify_all()
+
+    def shutdown(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self):
+        queue = self.server.queue
+        if self.path.rstrip("/") == "/jobs":
+            self._send(200, queue.list())
+        elif self.path.rstrip("/") == "/stats":
+            self._send(200, queue.stats())
+        elif self._job_id() in queue.jobs:
+            self._send(200, queue.get(self._job_id()))
+        else:
+            self._send(404, {'error': "Not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self._send(404, {'error': "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.queue.submit(request)
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+        self._send(201, job.to_dict())
+
+    def do_DELETE(self):
+        job_id = self._job_id()
+        if job_id not in self.server.queue.jobs:
+            self._send(404, {'error': "Not found"})
+            return
+        self._send(200, self.server.queue.cancel(job_id).to_dict())
+
+    def log_message(self, format, *args):
+        # Job events are logged by the queue, keep request logging quiet
+        pass
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=None):
+    """Run the job service until interrupted"""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.queue = JobQueue(workers, log=lambda message: print(message, flush=True))
+    print(f"Job server on http://{host}:{server.server_address[1]} with {server.queue.workers} workers",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.queue.shutdown()
+
+
+def _request(method, url, body=None, timeout=10):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read()).get('error', str(e)))
+
+
+def submit_job(params, priority=0, max_concurrency=None, url=DEFAULT_URL):
+    """Submit a job to a running server, returns the job dict"""
+    body = {key: params[key] for key in
+            ('method', 'coef_a', 'coef_b', 'clip_limit', 'input_folder', 'output_folder')}
+    body['compact'] = params.get('compact', False)
+    body['priority'] = priority
+    body['max_concurrency'] = max_concurrency
+    return _request("POST", f"{url}/jobs", body)
+
+
+def get_job(job_id, url=DEFAULT_URL):
+    return _request("GET", f"{url}/jobs/{job_id}")
+
+
+def list_jobs(url=DEFAULT_URL):
+    return _request("GET", f"{url}/jobs")
+
+
+def cancel_job(job_id, url=DEFAULT_URL):
+    return _request("DELETE", f"{url}/jobs/{job_id}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local DICOM enhancement job server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the job server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, help="Worker threads (default: CPU count)")
+
+    submit_parser = commands.add_parser("submit", help="Submit a job")
+    submit_parser.add_argument("input_folder")
+    submit_parser.add_argument("output_folder")
+    submit_parser.add_argument("--method", choices=METHODS, default=JOB_DEFAULTS['method'])
+    submit_parser.add_argument("--coef-a", type=float, default=JOB_DEFAULTS['coef_a'])
+    submit_parser.add_argument("--coef-b", type=float, default=JOB_DEFAULTS['coef_b'])
+    submit_parser.add_argument("--clip-limit", type=float, default=JOB_DEFAULTS['clip_limit'])
+    submit_parser.add_argument("--compact", action="store_true",
+                               help="Store enhanced pixels in the fewest bits that hold their range")
+    submit_parser.add_argument("--priority", type=int, default=0, help="Higher runs first")
+    submit_parser.add_argument("--max-concurrency", type=int,
+                               help="Files of this job processed at the same time")
+
+    status_parser = commands.add_parser("status", help="Show one job or all jobs")
+    status_parser.add_argument("job_id", nargs="?")
+
+    cancel_parser = commands.add_parser("cancel", help="Cancel a job")
+    cancel_parser.add_argument("job_id")
+
+    for command in (submit_parser, status_parser, cancel_parser):
+        command.add_argument("--url", default=DEFAULT_URL)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.workers)
+        return 0
+
+    try:
+        if args.command == "submit":
+            params = {
+                'method': args.method,
+                'coef_a': args.coef_a,
+                'coef_b': args.coef_b,
+                'clip_limit': args.clip_limit,
+                'compact': args.compact,
+                'input_folder': os.path.abspath(args.input_folder),
+                'output_folder': os.path.abspath(args.output_folder)
+            }
+            result = submit_job(params, args.priority, args.max_concurrency, args.url)
+        elif args.command == "status":
+            result = get_job(args.job_id, args.url) if args.job_id else list_jobs(args.url)
+        else:
+            result = cancel_job(args.job_id, args.url)
+    except (RuntimeError, urllib.error.URLError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Write-behind output stage: datasets are serialized in memory, written by a
+small thread pool under temporary names and atomically renamed into place
+
+Temporary files never end in .dcm, so a crash cannot leave a truncated file
+that looks like valid output.
+    fast  rename as soon as a file is written, no fsync
+    safe  fsync files in batches (every fsync_every files or when the series
+          changes), rename them only after that, then fsync the directories
+
+Windows can only fsync through a writable handle, so there safe mode syncs
+every file before closing it and only the renames are batched.
+A crash in safe mode can leave .partial files, see remove_stale_partials().
+"""
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DURABILITY_MODES = ("fast", "safe")
+
+# fsync needs the handle the file was written through (FlushFileBuffers on Windows)
+SYNC_ON_WRITE = os.name == "nt"
+
+
+def temp_path_for(output_path):
+    """Temporary name unique to this process and thread"""
+    directory, filename = os.path.split(output_path)
+    return os.path.join(directory, f".{filename}.{os.getpid()}.{threading.get_ident()}.partial")
+
+
+def fsync_path(path):
+    """fsync a closed file by reopening it, where the platform allows that"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def remove_stale_partials(folder, max_age=3600):
+    """
+    Remove temporary files left in folder by interrupted runs
+    Only files older than max_age seconds, so writers still running are not affected
+    Returns the number of files removed
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    for name in names:
+        if not (name.startswith('.') and name.endswith('.partial')):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def fsync_directory(directory):
+    """Make renames in directory durable, where the platform supports it"""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_file(path, data, fsync=False):
+    """
+    Write data to path, fsyncing through the still open (writable) handle
+    A partially written file is removed
+    """
+    try:
+        with open(path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+
+def serialize(ds_output):
+    """Encoded DICOM file as bytes"""
+    buffer = io.BytesIO()
+    ds_output.save_as(buffer)
+    return buffer.getvalue()
+
+
+def write_atomic(ds_output, output_path, fsync=False):
+    """Synchronously write a dataset to a temporary name and rename it into place"""
+    data = serialize(ds_output)
+    temp_path = temp_path_for(output_path)
+    write_file(temp_path, data, fsync)
+    try:
+        os.replace(temp_path, output_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+    if fsync:
+        fsync_directory(os.path.dirname(output_path))
+
+
+class OutputWriter:
+    """
+    Asynchronous writer for enhanced datasets
+    At most max_pending serialized files wait in memory, write() blocks beyond that
+    """
+
+    def __init__(self, workers=2, durability="fast", fsync_every=32, max_pending=16):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.durability = durability
+        self.fsync_every = max(1, fsync_every)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.futures = []
+        self.staged = []
+        self.failed = {}
+        self.group = None
+
+    def write(self, ds_output, output_path, group=None):
+        """
+        Queue ds_output for writing to output_path
+        In safe mode a new group (series) first commits the previous one
+        """
+        data = serialize(ds_output)
+
+        if self.durability == "safe" and group != self.group:
+            if self.group is not None:
+                self._wait()
+                self._commit(self._take_staged())
+            self.group = group
+
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(self._write, data, output_path)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.futures.append((output_path, future))
+
+    def _write(self, data, output_path):
+        temp_path = temp_path_for(output_path)
+        try:
+            write_file(temp_path, data, fsync=self.durability == "safe" and SYNC_ON_WRITE)
+        finally:
+            self.slots.release()
+
+        if self.durability == "fast":
+            self._rename(temp_path, output_path)
+            return
+
+        batch = None
+        with self.lock:
+            self.staged.append((temp_path, output_path))
+            if len(self.staged) >= self.fsync_every:
+                batch = self._take_staged(locked=True)
+        if batch:
+            self._commit(batch)
+
+    def _take_staged(self, locked=False):
+        if not locked:
+            with self.lock:
+                return self._take_staged(locked=True)
+        batch, self.staged = self.staged, []
+        return batch
+
+    def _rename(self, temp_path, output_path):
+        try:
+            os.replace(temp_path, output_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _commit(self, batch):
+        """fsync a batch of temporary files, rename them and fsync their directories"""
+        synced = []
+        for temp_path, output_path in batch:
+            try:
+                if not SYNC_ON_WRITE:
+                    fsync_path(temp_path)
+                synced.append((temp_path, output_path))
+            except OSError as e:
+                self._fail(output_path, e)
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+        committed = []
+        for temp_path, output_path in synced:
+            try:
+                self._rename(temp_path, output_path)
+                committed.append(output_path)
+            except OSError as e:
+                self._fail(output_path, e)
+
+        for directory in {os.path.dirname(output_path) for output_path in committed}:
+            fsync_directory(directory)
+
+    def _fail(self, output_path, error):
+        with self.lock:
+            self.failed[os.path.basename(output_path)] = str(error)
+
+    def _wait(self):
+        """Wait for every queued write, recording the ones that failed"""
+        with self.lock:
+            futures, self.futures = self.futures, []
+        for output_path, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                self._fail(output_path, e)
+
+    def flush(self):
+        """
+        Finish and commit everything written so far
+        Returns a dict of file names whose write failed since the last flush
+        """
+        self._wait()
+        self._commit(self._take_staged())
+        self.group = None
+        with self.lock:
+            failed, self.failed = self.failed, {}
+        return failed
+
+    def close(self):
+        failed = self.flush()
+        self.pool.shutdown()
+        return failed
@@ -0,0 +1,180 @@
+"""
+Windowed 8-bit PNG thumbnails and per-series before/after contact sheets,
+written from the arrays already in memory during processing
+"""
+import os
+import struct
+import zlib
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pydicom.multival import MultiValue
+
+
+def encode_png(gray):
+    """
+    Encode a 2-D uint8 array as a grayscale PNG
+    """
+    height, width = gray.shape
+
+    # Every scanline starts with filter type 0 (None)
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = gray
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def first_value(value):
+    """First value of a possibly multi-valued DICOM attribute"""
+    if isinstance(value, MultiValue):
+        value = value[0]
+    return float(value)
+
+
+def display_plane(pixel_array, ds):
+    """Single 2-D grayscale plane of a frame, multi-frame or color array"""
+    if getattr(ds, 'SamplesPerPixel', 1) > 1:
+        pixel_array = pixel_array.mean(axis=-1)
+    if pixel_array.ndim == 3:
+        pixel_array = pixel_array[0]
+    return pixel_array
+
+
+def get_window(ds, pixel_array):
+    """
+    (center, width) in rescaled units from the dataset, or the full range of the image
+    """
+    if 'WindowCenter' in ds and 'WindowWidth' in ds:
+        return first_value(ds.WindowCenter), max(first_value(ds.WindowWidth), 1.0)
+
+    slope = float(ds.get('RescaleSlope', 1.0))
+    intercept = float(ds.get('RescaleIntercept', 0.0))
+    low = float(np.min(pixel_array)) * slope + intercept
+    high = float(np.max(pixel_array)) * slope + intercept
+    return (low + high) / 2, max(high - low, 1.0)
+
+
+def downsample(plane, size):
+    """Area-average downsample so the longer side is at most size pixels"""
+    step = max(1, int(np.ceil(max(plane.shape) / size)))
+    if step == 1:
+        return plane.astype(np.float64)
+    rows = plane.shape[0] // step * step
+    cols = plane.shape[1] // step * step
+    blocks = plane[:rows, :cols].reshape(rows // step, step, cols // step, step)
+    return blocks.mean(axis=(1, 3))
+
+
+def render(pixel_array, ds, window, size):
+    """Windowed 8-bit thumbnail of stored pixel values"""
+    plane = downsample(display_plane(pixel_array, ds), size)
+
+    slope = float(ds.get('RescaleSlope', 1.0))
+    intercept = float(ds.get('RescaleIntercept', 0.0))
+    center, width = window
+    values = plane * slope + intercept
+    gray = np.clip((values - (center - width / 2)) / width * 255.0, 0, 255)
+
+    if ds.get('PhotometricInterpretation', '') == 'MONOCHROME1':
+        gray = 255.0 - gray
+
+    return np.round(gray).astype(np.uint8)
+
+
+class PreviewWriter:
+    """
+    Writes a thumbnail of every enhanced image and, on close, one before/after
+    contact sheet per series. Rendering and PNG encoding run on worker threads.
+    """
+
+    def __init__(self, preview_folder, size=256, workers=2):
+        self.preview_folder = preview_folder
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+        self.in_flight = set()
+        # Bound the number of full size arrays waiting for a worker
+        self.max_in_flight = workers * 4
+        os.makedirs(preview_folder, exist_ok=True)
+
+    def add(self, filename, ds, original_pixels, enhanced_pixels):
+        """Queue the thumbnail for one processed image"""
+        series = str(ds.get('SeriesInstanceUID', '')) or 'unknown_series'
+        instance = int(ds.get('InstanceNumber', 0) or 0)
+
+        if len(self.in_flight) >= self.max_in_flight:
+            _, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+
+        future = self.pool.submit(self._thumbnail, filename, ds, original_pixels, enhanced_pixels)
+        self.in_flight.add(future)
+        self.pending.append((series, instance, filename, future))
+
+    def _thumbnail(self, filename, ds, original_pixels, enhanced_pixels):
+        # Use the window of the original for both so the pair compares directly
+        window = get_window(ds, display_plane(original_pixels, ds))
+        before = render(original_pixels, ds, window, self.size)
+        after = render(enhanced_pixels, ds, window, self.size)
+
+        name = os.path.splitext(filename)[0] + '.png'
+        with open(os.path.join(self.preview_folder, name), 'wb') as f:
+            f.write(encode_png(after))
+
+        return before, after
+
+    def _contact_sheet(self, series, pairs, columns=4):
+        """Grid of before|after pairs, one pair per instance"""
+        gap = 4
+        cell_h = max(max(b.shape[0], a.shape[0]) for b, a in pairs)
+        cell_w = max(b.shape[1] + a.shape[1] for b, a in pairs) + gap
+        columns = min(columns, len(pairs))
+        rows = -(-len(pairs) // columns)
+
+        sheet = np.zeros((rows * (cell_h + gap), columns * (cell_w + gap)), dtype=np.uint8)
+        for index, (before, after) in enumerate(pairs):
+            top = (index // columns) * (cell_h + gap)
+            left = (index % columns) * (cell_w + gap)
+            sheet[top:top + before.shape[0], left:left + before.shape[1]] = before
+            left += before.shape[1] + gap
+            sheet[top:top + after.shape[0], left:left + after.shape[1]] = after
+
+        name = f"contact_{series}.png"
+        with open(os.path.join(self.preview_folder, name), 'wb') as f:
+            f.write(encode_png(sheet))
+
+    def close(self):
+        """
+        Wait for all thumbnails, then write the contact sheets
+        Returns the number of thumbnails written and a dict of failed
+        thumbnails and contact sheets
+        """
+        by_series = {}
+        written = 0
+        failed = {}
+        for series, instance, filename, future in self.pending:
+            try:
+                by_series.setdefault(series, []).append((instance, filename, future.result()))
+                written += 1
+            except Exception as e:
+                failed[filename] = str(e)
+
+        sheets = [
+            (series, self.pool.submit(self._contact_sheet, series,
+                                      [pair for _, _, pair in sorted(items, key=lambda item: item[:2])]))
+            for series, items in by_series.items()
+        ]
+        for series, sheet in sheets:
+            try:
+                sheet.result()
+            except Exception as e:
+                failed[f"contact_{series}.png"] = str(e)
+
+        self.pool.shutdown()
+        self.pending = []
+        self.in_flight = set()
+        return written, failed
@@ -0,0 +1,145 @@
+"""
+Deterministic partitioning of a batch across machines sharing one filesystem
+"""
+import hashlib
+import json
+import os
+import pydicom
+from collections import Counter
+
+SHARD_KEYS = ("series", "instance", "filename")
+
+# DICOM attribute used for each shard key
+SHARD_KEY_TAGS = {
+    "series": "SeriesInstanceUID",
+    "instance": "SOPInstanceUID",
+}
+
+
+def parse_shard(spec):
+    """
+    Parse an "i/N" shard specification into (index, count), with 0 <= i < N
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N (for example 0/4)")
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', index must be in 0..N-1")
+
+    return index, count
+
+
+def shard_key(input_path, key="series"):
+    """
+    Value hashed to place a file in a shard
+    Falls back to the file name when the UID is missing or unreadable
+    """
+    filename = os.path.basename(input_path)
+    if key == "filename":
+        return filename
+
+    tag = SHARD_KEY_TAGS[key]
+    try:
+        ds = pydicom.dcmread(input_path, stop_before_pixels=True, specific_tags=[tag])
+        value = str(ds.get(tag, "")).strip()
+    except Exception:
+        value = ""
+
+    return value or filename
+
+
+def shard_of(key_value, count):
+    """Stable shard index for a key, identical on every machine and Python run"""
+    digest = hashlib.sha1(key_value.encode("utf-8")).hexdigest()
+    return int(digest[:16], 16) % count
+
+
+def select_shard_files(input_folder, dicom_files, index, count, key="series"):
+    """Subset of dicom_files assigned to shard index of count"""
+    return [
+        filename for filename in dicom_files
+        if shard_of(shard_key(os.path.join(input_folder, filename), key), count) == index
+    ]
+
+
+def marker_path(output_folder, index, count):
+    """Location of the completion marker for one shard"""
+    return os.path.join(output_folder, f".shard-{index}-of-{count}.json")
+
+
+def clear_marker(output_folder, index, count):
+    """Remove a stale marker so a rerun never looks complete before it finishes"""
+    try:
+        os.remove(marker_path(output_folder, index, count))
+    except FileNotFoundError:
+        pass
+
+
+def write_marker(output_folder, index, count, key, params, assigned, processed, failed):
+    """
+    Atomically write the completion marker for one shard
+    """
+    marker = {
+        "shard": index,
+        "count": count,
+        "key": key,
+        "method": params['method'],
+        "coef_a": params['coef_a'],
+        "coef_b": params['coef_b'],
+        "clip_limit": params['clip_limit'],
+        "compact": bool(params.get('compact')),
+        "assigned": sorted(assigned),
+        "processed": sorted(processed),
+        "failed": failed,
+    }
+
+    path = marker_path(output_folder, index, count)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(marker, f, indent=2)
+    os.replace(temp_path, path)
+
+    return path
+
+
+def verify_shards(output_folder, count, dicom_files=None):
+    """
+    Check that every shard of a job has finished
+    Returns (complete, problems) where problems is a list of readable messages
+    """
+    problems = []
+    assigned = []
+    settings = set()
+    missing = 0
+
+    for index in range(count):
+        path = marker_path(output_folder, index, count)
+        if not os.path.exists(path):
+            problems.append(f"Shard {index}/{count} has no completion marker")
+            missing += 1
+            continue
+
+        with open(path) as f:
+            marker = json.load(f)
+
+        assigned.extend(marker["assigned"])
+        settings.add((marker["key"], marker["method"], marker["coef_a"],
+                      marker["coef_b"], marker["clip_limit"], marker.get("compact", False)))
+        for filename, error in marker["failed"].items():
+            problems.append(f"Shard {index}/{count} failed {filename}: {error}")
+
+    if len(settings) > 1:
+        problems.append("Shards were run with different keys, enhancement parameters or output encodings")
+
+    for filename, times in sorted(Counter(assigned).items()):
+        if times > 1:
+            problems.append(f"{filename} was assigned to more than one shard")
+
+    # Only meaningful once every shard has reported
+    if dicom_files is not None and not missing:
+        for filename in sorted(set(dicom_files) - set(assigned)):
+            problems.append(f"{filename} was not assigned to any shard")
+
+    return not problems, problems
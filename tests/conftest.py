@@ -0,0 +1,51 @@
+import os
+import sys
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+# The tool's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_ct(path, series_uid, rows=64, columns=64, seed=0, frames=1):
+    """Write a small signed 16-bit CT image with random pixels"""
+    shape = (frames, rows, columns) if frames > 1 else (rows, columns)
+    pixels = np.random.default_rng(seed).integers(-1000, 2000, size=shape).astype(np.int16)
+
+    file_meta = FileMetaDataset()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    file_meta.MediaStorageSOPClassUID = CTImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = "1.2.3"
+    ds.SeriesInstanceUID = series_uid
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.RescaleSlope = 1
+    ds.RescaleIntercept = 0
+    if frames > 1:
+        ds.NumberOfFrames = frames
+    ds.PixelData = pixels.tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+
+@pytest.fixture
+def dicom_folder(tmp_path):
+    """Folder of 12 CT images spread over 4 series"""
+    folder = tmp_path / "input"
+    folder.mkdir()
+    for i in range(12):
+        write_ct(str(folder / f"img{i:03d}.dcm"), f"1.2.3.{i % 4}", seed=i)
+    return folder
@@ -0,0 +1,92 @@
+import json
+import os
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset
+import backends
+from backends import (autotune, load_tuning, register_backend, save_tuning, select_backend,
+                      set_tuning_file, tuning_key)
+from enhancement import (linear_enhancement_fused, linear_enhancement_lut,
+                         linear_enhancement_reference)
+
+
+@pytest.fixture
+def tuning_file(tmp_path):
+    previous = backends._tuning_file
+    path = str(tmp_path / "backends.json")
+    set_tuning_file(path)
+    yield path
+    set_tuning_file(previous)
+
+
+@pytest.fixture
+def test_operation(monkeypatch):
+    """A throwaway 'double' operation with a correct and a wrong fast backend"""
+    monkeypatch.setitem(backends._backends, 'double', [])
+    register_backend('double', 'wrong', lambda pixels: pixels * 2 + 1,
+                     preferred=lambda pixels: True)
+    register_backend('double', 'fast', lambda pixels: pixels * 2)
+    register_backend('double', 'reference', lambda pixels: pixels + pixels, reference=True)
+    return 'double'
+
+
+def rescale(slope, intercept):
+    ds = Dataset()
+    ds.RescaleSlope = slope
+    ds.RescaleIntercept = intercept
+    return ds
+
+
+@pytest.mark.parametrize("dtype", [np.int8, np.uint8, np.int16, np.uint16])
+@pytest.mark.parametrize("slope, intercept", [(1, 0), (1, -1024), (0.75, -1024.5), (2.5, 3.25)])
+@pytest.mark.parametrize("backend", [linear_enhancement_lut, linear_enhancement_fused])
+def test_linear_backends_match_reference(dtype, slope, intercept, backend):
+    info = np.iinfo(dtype)
+    # Every stored value, in an image shape
+    pixels = np.arange(info.min, info.max + 1, dtype=np.int64).astype(dtype).reshape(-1, 256)
+    ds = rescale(slope, intercept)
+
+    expected = linear_enhancement_reference(pixels, 1.22, 5.0, ds)
+    result = backend(pixels, 1.22, 5.0, ds)
+
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_autotune_rejects_backends_with_different_output(tuning_file, test_operation):
+    pixels = np.arange(100, dtype=np.int16).reshape(10, 10)
+    messages = []
+
+    # Untuned, the preferred backend is used even though it is wrong
+    assert np.array_equal(select_backend(test_operation, pixels)(pixels), pixels * 2 + 1)
+
+    tuned = autotune(test_operation, [(pixels,)], repeats=1, log=messages.append)
+
+    assert tuned[tuning_key(test_operation, pixels)] in ("fast", "reference")
+    assert any("wrong rejected" in message for message in messages)
+    assert np.array_equal(select_backend(test_operation, pixels)(pixels), pixels * 2)
+
+
+def test_winners_are_saved_and_reloaded(tuning_file, test_operation):
+    pixels = np.arange(100, dtype=np.int16).reshape(10, 10)
+    key = tuning_key(test_operation, pixels)
+    winner = autotune(test_operation, [(pixels,)], repeats=1, log=lambda message: None)[key]
+    save_tuning()
+
+    set_tuning_file(tuning_file)
+    assert backends._tuned is None
+    assert load_tuning()[key] == winner
+    with open(tuning_file) as f:
+        assert json.load(f)['cpu_count'] == os.cpu_count()
+
+
+def test_tuning_from_another_machine_is_ignored(tuning_file, test_operation):
+    pixels = np.arange(100, dtype=np.int16).reshape(10, 10)
+    with open(tuning_file, "w") as f:
+        json.dump({'cpu_count': (os.cpu_count() or 1) + 1,
+                   'winners': {tuning_key(test_operation, pixels): "fast"}}, f)
+
+    set_tuning_file(tuning_file)
+    assert load_tuning() == {}
+    # Falls back to the untuned preference
+    assert np.array_equal(select_backend(test_operation, pixels)(pixels), pixels * 2 + 1)
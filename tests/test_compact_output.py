@@ -0,0 +1,148 @@
+import os
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+from compact_output import bits_needed, compact_encode, plan_encoding
+from enhancement import METHODS, build_output_dataset, enhance_contrast
+
+
+def dataset(pixels, slope=1, intercept=-1024, **attributes):
+    """Uncompressed single-frame dataset holding pixels at their own bit depth"""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = ds.BitsStored = pixels.dtype.itemsize * 8
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 1 if pixels.dtype.kind == 'i' else 0
+    if slope is not None:
+        ds.RescaleSlope = slope
+        ds.RescaleIntercept = intercept
+    for name, value in attributes.items():
+        setattr(ds, name, value)
+    ds.PixelData = pixels.tobytes()
+    return ds
+
+
+def encode(ds, pixels):
+    saved = compact_encode(ds, pixels, pixels.min(), pixels.max())
+    return saved, ds.pixel_array
+
+
+def rescaled(ds, stored):
+    return stored.astype(np.float64) * float(ds.get('RescaleSlope', 1)) \
+        + float(ds.get('RescaleIntercept', 0))
+
+
+def ramp(low, high, dtype=np.int16, shape=(16, 16)):
+    return np.linspace(low, high, shape[0] * shape[1]).round().astype(dtype).reshape(shape)
+
+
+def test_narrow_range_drops_to_8_bits():
+    pixels = ramp(-1000, -800)
+    ds = dataset(pixels)
+    expected = rescaled(ds, pixels)
+
+    saved, stored = encode(ds, pixels)
+
+    assert saved == pixels.nbytes // 2
+    assert (ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation) == (8, 8, 7, 0)
+    assert ds['PixelData'].VR == 'OB'
+    assert ds.RescaleIntercept == -2024
+    assert np.array_equal(rescaled(ds, stored), expected)
+
+
+@pytest.mark.parametrize("slope, intercept", [(0.5, -1024), (1, -1024.5)])
+def test_no_shift_without_integer_modality_lut(slope, intercept):
+    pixels = ramp(-1000, -800)
+    ds = dataset(pixels, slope, intercept)
+    expected = rescaled(ds, pixels)
+
+    saved, stored = encode(ds, pixels)
+
+    assert saved == 0
+    assert (ds.BitsAllocated, ds.BitsStored, ds.PixelRepresentation) == (16, 11, 1)
+    assert float(ds.RescaleIntercept) == intercept
+    assert np.array_equal(rescaled(ds, stored), expected)
+
+
+def test_no_shift_without_modality_lut():
+    pixels = ramp(-100, 100)
+    ds = dataset(pixels, slope=None)
+    offset, bits_stored, bits_allocated, pixel_representation, intercept = \
+        plan_encoding(ds, -100, 100)
+    assert (offset, bits_stored, bits_allocated, pixel_representation, intercept) == \
+        (0, 8, 8, 1, None)
+
+
+def test_signed_becomes_unsigned():
+    pixels = ramp(0, 3000)
+    ds = dataset(pixels, slope=None)
+
+    saved, stored = encode(ds, pixels)
+
+    assert saved == 0
+    assert (ds.BitsAllocated, ds.BitsStored, ds.PixelRepresentation) == (16, 12, 0)
+    assert stored.dtype == np.uint16
+    assert np.array_equal(stored, pixels)
+
+
+def test_padding_value_is_shifted_with_the_pixels():
+    pixels = ramp(-1000, -800)
+    pixels[0, 0] = -2000
+    ds = dataset(pixels, PixelPaddingValue=-2000)
+    ds['PixelPaddingValue'].VR = 'SS'
+    expected = rescaled(ds, pixels)
+
+    _, stored = encode(ds, pixels)
+
+    # The padding value widens the range to 1201 values, which needs 11 bits
+    assert (ds.BitsAllocated, ds.BitsStored, ds.PixelRepresentation) == (16, 11, 0)
+    assert ds.PixelPaddingValue == 0
+    assert ds['PixelPaddingValue'].VR == 'US'
+    assert stored[0, 0] == ds.PixelPaddingValue
+    assert np.array_equal(rescaled(ds, stored), expected)
+
+
+def test_wider_than_input_is_left_unchanged():
+    pixels = ramp(0, 200, dtype=np.uint8)
+    ds = dataset(pixels, slope=None, PixelPaddingValue=1000)
+    original = ds.PixelData
+
+    assert compact_encode(ds, pixels, pixels.min(), pixels.max()) == 0
+    assert ds.PixelData == original
+    assert (ds.BitsAllocated, ds.BitsStored) == (8, 8)
+
+
+def test_stale_value_statistics_are_removed():
+    pixels = ramp(-1000, -800)
+    ds = dataset(pixels, SmallestImagePixelValue=-1000, LargestImagePixelValue=-800)
+    encode(ds, pixels)
+    assert 'SmallestImagePixelValue' not in ds and 'LargestImagePixelValue' not in ds
+
+
+@pytest.mark.parametrize("low, high, signed, bits", [
+    (0, 1, False, 1), (0, 255, False, 8), (0, 256, False, 9),
+    (-128, 127, True, 8), (-129, 0, True, 9),
+])
+def test_bits_needed(low, high, signed, bits):
+    assert bits_needed(low, high, signed) == bits
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("intercept", [0, -1024])
+def test_compact_output_has_the_same_rescaled_values(dicom_folder, method, intercept):
+    ds = pydicom.dcmread(os.path.join(dicom_folder, "img000.dcm"))
+    ds.RescaleIntercept = intercept
+    params = {'method': method, 'coef_a': 0.2, 'coef_b': 5.0, 'clip_limit': 0.01}
+    enhanced = enhance_contrast(ds, params['coef_a'], params['coef_b'], params['clip_limit'], method)
+
+    full = build_output_dataset(ds, enhanced, dict(params, compact=False))
+    compact = build_output_dataset(ds, enhanced, dict(params, compact=True))
+
+    assert len(compact.PixelData) <= len(full.PixelData)
+    assert np.array_equal(rescaled(compact, compact.pixel_array), rescaled(full, full.pixel_array))
@@ -0,0 +1,23 @@
+import numpy as np
+from dedup_cache import EnhancementCache
+
+
+def test_eviction_trims_to_low_water_mark(tmp_path):
+    pixels = np.zeros((100, 100), dtype=np.int16)
+    cache = EnhancementCache(str(tmp_path), max_bytes=200_000)
+    for i in range(30):
+        cache.put(f"{i:064x}", pixels)
+
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get(f"{29:064x}") is not None
+    assert cache.get(f"{0:064x}") is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    pixels = np.arange(100, dtype=np.int16)
+    EnhancementCache(str(tmp_path)).put("ab" * 32, pixels)
+
+    cache = EnhancementCache(str(tmp_path))
+    assert cache.stats()['entries'] == 1
+    assert np.array_equal(cache.get("ab" * 32), pixels)
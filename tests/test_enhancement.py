@@ -0,0 +1,25 @@
+import os
+import numpy as np
+import pydicom
+import pytest
+from enhancement import METHODS, build_output_dataset, enhance_contrast
+
+PARAMS = {'coef_a': 1.22, 'coef_b': 5.0, 'clip_limit': 0.01}
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_input_dataset_is_not_modified(dicom_folder, method):
+    ds = pydicom.dcmread(os.path.join(dicom_folder, "img000.dcm"))
+    original_pixels = ds.pixel_array.copy()
+    original_bytes = ds.PixelData
+    params = dict(PARAMS, method=method)
+
+    enhanced_pixels = enhance_contrast(ds, params['coef_a'], params['coef_b'],
+                                       params['clip_limit'], method)
+    ds_output = build_output_dataset(ds, enhanced_pixels, dict(params, compact=True))
+
+    assert ds.PixelData == original_bytes
+    assert np.array_equal(ds.pixel_array, original_pixels)
+    assert 0x00071001 not in ds
+    assert np.array_equal(ds_output.pixel_array.astype(np.int32) * int(ds_output.RescaleSlope)
+                          + int(ds_output.RescaleIntercept), enhanced_pixels)
@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from http.server import ThreadingHTTPServer
+from job_server import JobQueue, JobRequestHandler, get_job, submit_job
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JobRequestHandler)
+    server.queue = JobQueue(2, log=lambda message: None)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    server.queue.shutdown()
+
+
+def post(url, data):
+    request = urllib.request.Request(f"{url}/jobs", data=data, method="POST",
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_job_runs_to_completion(server_url, dicom_folder, tmp_path):
+    params = {'method': "clahe_then_linear", 'coef_a': 1.22, 'coef_b': 5.0, 'clip_limit': 0.01,
+              'input_folder': str(dicom_folder), 'output_folder': str(tmp_path / "output")}
+    job = submit_job(params, url=server_url)
+
+    deadline = time.time() + 30
+    while job['status'] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.05)
+        job = get_job(job['id'], url=server_url)
+    assert job['status'] == "completed"
+    assert job['processed'] == job['total'] == 12
+
+
+@pytest.mark.parametrize("body", [b"[]", b"42", b"not json", b'{"method": "sharpen"}'])
+def test_bad_requests_are_rejected(server_url, body):
+    status, reply = post(server_url, body)
+    assert status == 400
+    assert reply['error']
+
+
+def test_uncreatable_output_folder_is_rejected(server_url, dicom_folder, tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    body = {'input_folder': str(dicom_folder), 'output_folder': str(blocker / "output")}
+    status, reply = post(server_url, json.dumps(body).encode())
+    assert status == 400
+    assert "Cannot create output folder" in reply['error']
+
+
+@pytest.mark.parametrize("compact, expected", [(False, False), (True, True), ("false", False),
+                                               ("0", False), ("true", True), ("1", True)])
+def test_compact_flag_is_parsed(server_url, dicom_folder, tmp_path, compact, expected):
+    body = {'input_folder': str(dicom_folder), 'output_folder': str(tmp_path / "output"),
+            'compact': compact}
+    status, reply = post(server_url, json.dumps(body).encode())
+    assert status == 201
+    assert reply['compact'] is expected
+
+
+@pytest.mark.parametrize("compact", ["maybe", 2, [True]])
+def test_invalid_compact_flag_is_rejected(server_url, dicom_folder, tmp_path, compact):
+    body = {'input_folder': str(dicom_folder), 'output_folder': str(tmp_path / "output"),
+            'compact': compact}
+    status, reply = post(server_url, json.dumps(body).encode())
+    assert status == 400
+    assert "compact" in reply['error']
@@ -0,0 +1,106 @@
+import os
+import struct
+import zlib
+import numpy as np
+import pydicom
+from conftest import write_ct
+from enhancement import enhance_contrast, process_files
+from previews import PreviewWriter, encode_png, get_window, render
+
+PARAMS = {'method': "linear_only", 'coef_a': 1.5, 'coef_b': 5.0, 'clip_limit': 0.01}
+
+
+def decode_png(data):
+    """2-D uint8 array of a PNG written by encode_png"""
+    assert data.startswith(b'\x89PNG\r\n\x1a\n')
+    width, height = struct.unpack('>II', data[16:24])
+    idat_length = struct.unpack('>I', data[33:37])[0]
+    raw = zlib.decompress(data[41:41 + idat_length])
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(height, width + 1)
+    assert not rows[:, 0].any()
+    return rows[:, 1:]
+
+
+def run(input_folder, output_folder, preview_folder, size):
+    params = dict(PARAMS, input_folder=str(input_folder), output_folder=str(output_folder))
+    os.makedirs(output_folder)
+    previews = PreviewWriter(str(preview_folder), size)
+    processed, failed = process_files(params, sorted(os.listdir(input_folder)),
+                                      log=lambda message: None, previews=previews)
+    assert not failed
+    return previews.close()
+
+
+def test_thumbnails_and_contact_sheets(dicom_folder, tmp_path):
+    preview_folder = tmp_path / "previews"
+    written, failed = run(dicom_folder, tmp_path / "output", preview_folder, size=32)
+
+    assert (written, failed) == (12, {})
+    names = sorted(os.listdir(preview_folder))
+    thumbnails = [name for name in names if not name.startswith("contact_")]
+    assert thumbnails == [f"img{i:03d}.png" for i in range(12)]
+    assert [name for name in names if name.startswith("contact_")] == \
+        [f"contact_1.2.3.{i}.png" for i in range(4)]
+
+    for name in thumbnails:
+        assert decode_png((preview_folder / name).read_bytes()).shape == (32, 32)
+
+
+def test_thumbnail_size_keeps_aspect_ratio(tmp_path):
+    input_folder = tmp_path / "input"
+    input_folder.mkdir()
+    write_ct(str(input_folder / "wide.dcm"), "1.2.3", rows=40, columns=100)
+
+    run(input_folder, tmp_path / "output", tmp_path / "previews", size=50)
+    assert decode_png((tmp_path / "previews" / "wide.png").read_bytes()).shape == (20, 50)
+
+
+def test_before_and_after_use_the_original_window(dicom_folder, tmp_path):
+    ds = pydicom.dcmread(dicom_folder / "img000.dcm")
+    original = ds.pixel_array
+    enhanced = enhance_contrast(ds, PARAMS['coef_a'], PARAMS['coef_b'], 0.01, "linear_only")
+    window = get_window(ds, original)
+    assert window == get_window(ds, original.copy())
+    assert window != get_window(ds, enhanced)
+
+    preview_folder = tmp_path / "previews"
+    writer = PreviewWriter(str(preview_folder), size=64)
+    writer.add("img000.dcm", ds, original, enhanced)
+    [(_, _, _, future)] = writer.pending
+    before, after = future.result()
+    assert writer.close() == (1, {})
+
+    assert np.array_equal(before, render(original, ds, window, 64))
+    assert np.array_equal(after, render(enhanced, ds, window, 64))
+    assert np.array_equal(decode_png((preview_folder / "img000.png").read_bytes()), after)
+
+
+def test_window_from_dataset_tags(dicom_folder):
+    ds = pydicom.dcmread(dicom_folder / "img000.dcm")
+    ds.WindowCenter = [40, 400]
+    ds.WindowWidth = [400, 2000]
+    assert get_window(ds, ds.pixel_array) == (40.0, 400.0)
+
+
+def test_monochrome1_is_inverted(dicom_folder):
+    ds = pydicom.dcmread(dicom_folder / "img000.dcm")
+    window = get_window(ds, ds.pixel_array)
+    monochrome2 = render(ds.pixel_array, ds, window, 64)
+    ds.PhotometricInterpretation = "MONOCHROME1"
+    assert np.array_equal(render(ds.pixel_array, ds, window, 64), 255 - monochrome2)
+
+
+def test_encode_png_round_trip():
+    gray = np.arange(12 * 7, dtype=np.uint8).reshape(12, 7)
+    assert np.array_equal(decode_png(encode_png(gray)), gray)
+
+
+def test_failed_contact_sheet_is_reported(dicom_folder, tmp_path, monkeypatch):
+    def fail(self, series, pairs, columns=4):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(PreviewWriter, "_contact_sheet", fail)
+    written, failed = run(dicom_folder, tmp_path / "output", tmp_path / "previews", size=32)
+
+    assert written == 12
+    assert failed == {f"contact_1.2.3.{i}.png": "disk full" for i in range(4)}
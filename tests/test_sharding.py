@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+import pytest
+import cli
+from sharding import marker_path, verify_shards
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("shard_by", ["series", "instance", "filename"])
+def test_shards_cover_every_file_once(dicom_folder, tmp_path, shard_by):
+    output = tmp_path / "output"
+    count = 3
+    for index in range(count):
+        assert cli.main([str(dicom_folder), str(output), "--shard", f"{index}/{count}",
+                         "--shard-by", shard_by]) == 0
+
+    dicom_files = sorted(os.listdir(dicom_folder))
+    complete, problems = verify_shards(str(output), count, dicom_files)
+    assert complete, problems
+    assert sorted(f for f in os.listdir(output) if f.endswith(".dcm")) == dicom_files
+
+
+def test_shards_in_parallel_processes(dicom_folder, tmp_path):
+    output = tmp_path / "output"
+    count = 4
+    processes = [
+        subprocess.Popen([sys.executable, "cli.py", str(dicom_folder), str(output),
+                          "--shard", f"{index}/{count}"], cwd=REPO, stdout=subprocess.DEVNULL)
+        for index in range(count)
+    ]
+    assert [process.wait() for process in processes] == [0] * count
+
+    assigned = Counter()
+    for index in range(count):
+        with open(marker_path(str(output), index, count)) as f:
+            assigned.update(json.load(f)["assigned"])
+    assert assigned == Counter(os.listdir(dicom_folder))
+
+    assert cli.main([str(dicom_folder), str(output), "--verify-shards", str(count)]) == 0
+
+
+def test_missing_marker_fails_verification(dicom_folder, tmp_path):
+    output = tmp_path / "output"
+    for index in range(2):
+        cli.main([str(dicom_folder), str(output), "--shard", f"{index}/2"])
+    os.remove(marker_path(str(output), 1, 2))
+
+    complete, problems = verify_shards(str(output), 2, sorted(os.listdir(dicom_folder)))
+    assert not complete
+    assert any("no completion marker" in problem for problem in problems)
+
+
+def test_invalid_shard_is_a_usage_error(dicom_folder, tmp_path):
+    output = tmp_path / "output"
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main([str(dicom_folder), str(output), "--shard", "5/3"])
+    assert exit_info.value.code == 2
+    assert not output.exists()
+
+
+def test_mixed_compact_fails_verification(dicom_folder, tmp_path):
+    output = tmp_path / "output"
+    cli.main([str(dicom_folder), str(output), "--shard", "0/2"])
+    cli.main([str(dicom_folder), str(output), "--shard", "1/2", "--compact"])
+
+    complete, problems = verify_shards(str(output), 2, sorted(os.listdir(dicom_folder)))
+    assert not complete
+    assert any("output encodings" in problem for problem in problems)
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from enhancement import clahe_reference
+from tiled_clahe import TILED_AVAILABLE, apply_clahe_tiled
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tiled backend reimplements skimage's private _clahe and is used by default
+# for large images, so any skimage change that alters the result must fail here
+
+
+@pytest.mark.skipif(not TILED_AVAILABLE, reason="skimage private CLAHE helpers not found")
+@pytest.mark.parametrize("shape, dtype", [
+    ((1500, 1999), np.int16),
+    ((513, 257), np.int32),
+    ((7, 9), np.uint16),
+])
+@pytest.mark.parametrize("workers", [None, 3])
+def test_tiled_matches_reference(shape, dtype, workers):
+    info = np.iinfo(dtype)
+    low, high = max(info.min, -2000), min(info.max, 4000)
+    pixels = np.random.default_rng(0).integers(low, high, size=shape).astype(dtype)
+
+    expected = clahe_reference(pixels, 0.01)
+    result = apply_clahe_tiled(pixels, 0.01, workers=workers)
+
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.skipif(not TILED_AVAILABLE, reason="skimage private CLAHE helpers not found")
+def test_constant_image_is_unchanged():
+    pixels = np.full((64, 80), 42, dtype=np.int16)
+    assert np.array_equal(apply_clahe_tiled(pixels, 0.01), pixels)
+
+
+def test_missing_private_helpers_fall_back_to_skimage():
+    # Simulate a scikit-image release that renamed the private helpers
+    script = (
+        "import skimage.exposure._adapthist as adapthist\n"
+        "clip_histogram = adapthist.clip_histogram\n"
+        "del adapthist.clip_histogram\n"
+        "import numpy as np\n"
+        "import backends, enhancement\n"
+        "adapthist.clip_histogram = clip_histogram\n"
+        "assert [b['name'] for b in backends._backends['clahe']] == ['skimage']\n"
+        "pixels = np.random.default_rng(0).integers(-1000, 2000, (1024, 1024)).astype(np.int16)\n"
+        "assert np.array_equal(enhancement.apply_clahe(pixels, 0.01),\n"
+        "                      enhancement.clahe_reference(pixels, 0.01))\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=REPO, check=True)
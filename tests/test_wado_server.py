@@ -0,0 +1,176 @@
+import io
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pydicom
+import pytest
+import wado_server
+from conftest import write_ct
+from wado_server import EnhancedImageService, WadoRequestHandler
+
+
+def uids(path):
+    ds = pydicom.dcmread(path, stop_before_pixels=True)
+    return str(ds.StudyInstanceUID), str(ds.SeriesInstanceUID), str(ds.SOPInstanceUID)
+
+
+def instance_url(path):
+    study, series, instance = uids(path)
+    return f"/studies/{study}/series/{series}/instances/{instance}"
+
+
+@pytest.fixture
+def enhance_calls(monkeypatch):
+    """Number of enhance_contrast runs, per method"""
+    calls = []
+    real_enhance = wado_server.enhance_contrast
+
+    def enhance_contrast(ds, coef_a, coef_b, clip_limit, method):
+        calls.append(method)
+        return real_enhance(ds, coef_a, coef_b, clip_limit, method)
+
+    monkeypatch.setattr(wado_server, "enhance_contrast", enhance_contrast)
+    return calls
+
+
+@pytest.fixture
+def server(dicom_folder):
+    write_ct(os.path.join(dicom_folder, "multiframe.dcm"), "1.2.3.8", frames=3, seed=50)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WadoRequestHandler)
+    server.service = EnhancedImageService(str(dicom_folder))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path):
+    """(status, content type, body) of a GET request"""
+    try:
+        with urllib.request.urlopen(server.url + path, timeout=30) as response:
+            return response.status, response.headers["Content-Type"], response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers["Content-Type"], e.read()
+
+
+def png_size(body):
+    assert body.startswith(b"\x89PNG")
+    return int.from_bytes(body[16:20], "big"), int.from_bytes(body[20:24], "big")
+
+
+def test_instance_list(server, dicom_folder):
+    status, content_type, body = get(server, "/instances")
+    assert (status, content_type) == (200, "application/json")
+    assert sorted(item['file'] for item in json.loads(body)) == sorted(os.listdir(dicom_folder))
+
+
+def test_enhanced_instance(server, dicom_folder):
+    url = instance_url(dicom_folder / "img003.dcm")
+    status, content_type, body = get(server, url + "?method=clahe_then_linear&compact=true")
+
+    assert (status, content_type) == (200, "application/dicom")
+    ds = pydicom.dcmread(io.BytesIO(body))
+    assert ds[0x00071002].value.startswith("CLAHE then Linear")
+
+
+def test_one_computation_per_instance_and_parameters(server, dicom_folder, enhance_calls):
+    url = instance_url(dicom_folder / "img003.dcm")
+    query = "?method=clahe_then_linear"
+
+    assert get(server, url + query)[0] == 200
+    for size in (16, 32, 64):
+        status, content_type, body = get(server, f"{url}/rendered{query}&size={size}")
+        assert (status, content_type) == (200, "image/png")
+        assert png_size(body) == (size, size)
+    assert get(server, f"{url}/frames/1/rendered{query}")[0] == 200
+
+    assert enhance_calls == ["clahe_then_linear"]
+
+    # Other parameters are a separate computation
+    assert get(server, url + "?method=linear_only")[0] == 200
+    assert enhance_calls == ["clahe_then_linear", "linear_only"]
+
+
+def test_every_frame_shares_one_computation(server, dicom_folder, enhance_calls):
+    url = instance_url(dicom_folder / "multiframe.dcm")
+    bodies = set()
+    for frame in (1, 2, 3):
+        status, content_type, body = get(server, f"{url}/frames/{frame}/rendered")
+        assert (status, content_type) == (200, "image/png")
+        bodies.add(body)
+
+    assert len(bodies) == 3
+    assert enhance_calls == ["linear_only"]
+    assert get(server, f"{url}/frames/4/rendered")[0] == 404
+
+
+def test_concurrent_requests_are_computed_once(server, dicom_folder, enhance_calls):
+    url = instance_url(dicom_folder / "img005.dcm") + "/rendered?method=clahe_only"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get(server, url)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _, _ in results] == [200] * 8
+    assert len({body for _, _, body in results}) == 1
+    assert enhance_calls == ["clahe_only"]
+
+
+@pytest.mark.parametrize("suffix, status", [
+    ("/frames/2/rendered", 404),
+    ("/frames/0/rendered", 404),
+    ("/frames/x/rendered", 400),
+    ("/rendered?size=abc", 400),
+    ("/rendered?size=0", 400),
+    ("?method=sharpen", 400),
+    ("?coef_a=high", 400),
+    ("/thumbnail", 404),
+])
+def test_bad_requests(server, dicom_folder, suffix, status):
+    response_status, content_type, body = get(server, instance_url(dicom_folder / "img000.dcm") + suffix)
+    assert (response_status, content_type) == (status, "application/json")
+    assert json.loads(body)['error']
+
+
+@pytest.mark.parametrize("path", ["/studies/1/series/2/instances/3", "/studies/1", "/nothing"])
+def test_unknown_paths(server, path):
+    status, _, body = get(server, path)
+    assert status == 404
+    assert json.loads(body)['error']
+
+
+def test_stats(server, dicom_folder):
+    url = instance_url(dicom_folder / "img000.dcm")
+    get(server, url)
+    get(server, url)
+
+    status, _, body = get(server, "/stats")
+    stats = json.loads(body)
+    assert status == 200
+    assert (stats['responses']['hits'], stats['responses']['misses']) == (1, 1)
+    assert stats['enhanced']['misses'] == 1
+    assert 'pixels' not in stats
+
+
+def test_unknown_instances_rescan_at_most_once_per_interval(dicom_folder):
+    service = EnhancedImageService(str(dicom_folder), rescan_seconds=3600)
+    index = service.index
+    scanned_at = index.scanned_at
+
+    assert index.find("1", "2", "3") is None
+    assert index.scanned_at == scanned_at
+
+    # New files show up once the interval has passed
+    new_path = os.path.join(dicom_folder, "new.dcm")
+    write_ct(new_path, "1.2.3.9", seed=99)
+    assert index.find(*uids(new_path)) is None
+    index.rescan_seconds = 0
+    assert index.find(*uids(new_path)) == new_path
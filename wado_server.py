@@ -0,0 +1,377 @@
+"""
+On-demand enhanced images over local HTTP, modeled on DICOMweb WADO-RS
+
+    python wado_server.py FOLDER --port 8766 --cache-dir ~/.dicom_enhancer/render
+
+    GET /studies/<study>/series/<series>/instances/<instance>
+        enhanced instance as application/dicom
+    GET /studies/<study>/series/<series>/instances/<instance>/rendered
+    GET /studies/<study>/series/<series>/instances/<instance>/frames/<n>/rendered
+        windowed 8-bit PNG of the enhanced image (frame n, 1-based)
+    GET /instances
+        every indexed instance as JSON
+    GET /stats
+        cache statistics
+
+Query parameters: method, coef_a, coef_b, clip_limit, compact and, for
+rendered images, size (longest side in pixels). The first request for an
+instance and parameter set runs enhance_contrast; the enhanced pixels are kept
+in a bounded in-memory cache shared by the instance, every frame and every
+rendered size, above an optional on-disk cache. Finished responses are cached
+as well, and concurrent identical requests are computed once.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pydicom
+from dedup_cache import KEY_PARAMS, EnhancementCache
+from enhancement import METHODS, build_output_dataset, enhance_contrast, list_dicom_files
+from job_server import JOB_DEFAULTS
+from output_writer import serialize
+from previews import encode_png, get_window, render
+
+DEFAULT_PORT = 8766
+
+
+def body_size(value):
+    """Size of a (content type, body) response"""
+    return len(value[1])
+
+
+def enhanced_size(value):
+    """Size of a (dataset, enhanced pixels) pair, counting the decoded original too"""
+    ds, enhanced_pixels = value
+    return len(ds.PixelData) + ds.pixel_array.nbytes + enhanced_pixels.nbytes
+
+
+class RenderCache:
+    """
+    Least recently used cache of values bounded by their total size, where
+    concurrent requests for a key that is being computed wait for that result
+    """
+
+    def __init__(self, max_bytes, sizeof=body_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.size = 0
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except Exception as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.in_flight[key]
+            self._put(key, value)
+        future.set_result(value)
+        return value
+
+    def _put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+            }
+
+
+class InstanceIndex:
+    """
+    (study, series, instance) UIDs to file paths for one folder
+    Unknown UIDs rescan the folder for new files, at most once every
+    rescan_seconds, and concurrent misses share one scan
+    """
+
+    def __init__(self, folder, rescan_seconds=10.0):
+        self.folder = folder
+        self.rescan_seconds = rescan_seconds
+        self.paths = {}
+        self.scanned_at = 0.0
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        with self.scan_lock:
+            self._scan()
+
+    def _scan(self):
+        paths = {}
+        for filename in list_dicom_files(self.folder):
+            path = os.path.join(self.folder, filename)
+            try:
+                ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=[
+                    'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID'])
+                key = (str(ds.StudyInstanceUID), str(ds.SeriesInstanceUID), str(ds.SOPInstanceUID))
+            except Exception:
+                continue
+            paths[key] = path
+        with self.lock:
+            self.paths = paths
+            self.scanned_at = time.monotonic()
+
+    def find(self, study, series, instance):
+        """Path for the UIDs, or None"""
+        key = (study, series, instance)
+        with self.lock:
+            path = self.paths.get(key)
+        if path is not None:
+            return path
+
+        with self.scan_lock:
+            # Another request may have rescanned while this one waited
+            with self.lock:
+                path = self.paths.get(key)
+                due = time.monotonic() - self.scanned_at >= self.rescan_seconds
+            if path is None and due:
+                self._scan()
+                with self.lock:
+                    path = self.paths.get(key)
+        return path
+
+    def list(self):
+        with self.lock:
+            return [{'study': study, 'series': series, 'instance': instance,
+                     'file': os.path.basename(path)}
+                    for (study, series, instance), path in sorted(self.paths.items())]
+
+
+def parse_params(query):
+    """Enhancement parameters from a query string dict, raising ValueError"""
+    params = dict(JOB_DEFAULTS)
+    for key in JOB_DEFAULTS:
+        if key in query:
+            params[key] = query[key][0]
+
+    if params['method'] not in METHODS:
+        raise ValueError(f"Unknown enhancement method: {params['method']}")
+    for key in ('coef_a', 'coef_b', 'clip_limit'):
+        params[key] = float(params[key])
+    params['compact'] = str(params['compact']).lower() in ("1", "true", "yes")
+    return params
+
+
+class EnhancedImageService:
+    """Computes enhanced instances and rendered frames through the caches"""
+
+    def __init__(self, folder, memory_bytes=256 * 1024 ** 2, cache_dir=None,
+                 disk_bytes=2 * 1024 ** 3, rescan_seconds=10.0, pixel_bytes=512 * 1024 ** 2):
+        self.index = InstanceIndex(folder, rescan_seconds)
+        self.responses = RenderCache(memory_bytes)
+        self.enhanced = RenderCache(pixel_bytes, sizeof=enhanced_size)
+        self.pixels = EnhancementCache(cache_dir, disk_bytes) if cache_dir else None
+        self.folder = folder
+
+    def _enhance(self, path, params):
+        """
+        (dataset, enhanced pixels) for one instance, shared by every response
+        built from it: the instance, each frame and each rendered size
+        """
+        key = (path,) + tuple(params[name] for name in KEY_PARAMS)
+        return self.enhanced.get_or_compute(key, lambda: self._compute(path, params))
+
+    def _compute(self, path, params):
+        ds = pydicom.dcmread(path)
+        # Decode the original once here, so later readers of the cached dataset share it
+        ds.pixel_array
+        enhanced_pixels = None
+        if self.pixels is not None:
+            cache_key = self.pixels.key(ds, params)
+            enhanced_pixels = self.pixels.get(cache_key)
+        if enhanced_pixels is None:
+            enhanced_pixels = enhance_contrast(ds, params['coef_a'], params['coef_b'],
+                                               params['clip_limit'], params['method'])
+            if self.pixels is not None:
+                self.pixels.put(cache_key, enhanced_pixels)
+        return ds, enhanced_pixels
+
+    def instance(self, path, params):
+        """(content type, body) of the enhanced DICOM instance"""
+        key = ('instance', path, tuple(sorted(params.items())))
+
+        def compute():
+            ds, enhanced_pixels = self._enhance(path, params)
+            return "application/dicom", serialize(build_output_dataset(ds, enhanced_pixels, params))
+
+        return self.responses.get_or_compute(key, compute)
+
+    def rendered(self, path, params, frame=1, size=None):
+        """(content type, body) of a windowed PNG of one enhanced frame"""
+        key = ('rendered', path, tuple(sorted(params.items())), frame, size)
+
+        def compute():
+            ds, enhanced_pixels = self._enhance(path, params)
+            original_pixels = ds.pixel_array
+            if enhanced_pixels.ndim == 3 and ds.get('SamplesPerPixel', 1) == 1:
+                if not 1 <= frame <= enhanced_pixels.shape[0]:
+                    raise LookupError(f"Frame {frame} not found")
+                enhanced_pixels = enhanced_pixels[frame - 1]
+                original_pixels = original_pixels[frame - 1]
+            elif frame != 1:
+                raise LookupError(f"Frame {frame} not found")
+
+            # Window of the original, as in the QA previews
+            window = get_window(ds, original_pixels)
+            longest = size or max(enhanced_pixels.shape[:2])
+            return "image/png", encode_png(render(enhanced_pixels, ds, window, longest))
+
+        return self.responses.get_or_compute(key, compute)
+
+
+class WadoRequestHandler(BaseHTTPRequestHandler):
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, body):
+        self._send(status, "application/json", json.dumps(body).encode("utf-8"))
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["instances"]:
+            self._send_json(200, service.index.list())
+            return
+        if parts == ["stats"]:
+            stats = {'responses': service.responses.stats(), 'enhanced': service.enhanced.stats()}
+            if service.pixels is not None:
+                stats['pixels'] = service.pixels.stats()
+            self._send_json(200, stats)
+            return
+
+        if (len(parts) < 6 or parts[0] != "studies" or parts[2] != "series"
+                or parts[4] != "instances"):
+            self._send_json(404, {'error': "Not found"})
+            return
+
+        path = service.index.find(parts[1], parts[3], parts[5])
+        if path is None:
+            self._send_json(404, {'error': "Instance not found"})
+            return
+
+        try:
+            query = parse_qs(url.query)
+            params = parse_params(query)
+            rest = parts[6:]
+            if not rest:
+                content_type, body = service.instance(path, params)
+            elif rest == ["rendered"] or (len(rest) == 3 and rest[0] == "frames"
+                                          and rest[2] == "rendered"):
+                frame = int(rest[1]) if rest[0] == "frames" else 1
+                size = int(query['size'][0]) if 'size' in query else None
+                if size is not None and size < 1:
+                    raise ValueError("size must be at least 1")
+                content_type, body = service.rendered(path, params, frame, size)
+            else:
+                self._send_json(404, {'error': "Not found"})
+                return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except LookupError as e:
+            self._send_json(404, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self._send(200, content_type, body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(folder, host="127.0.0.1", port=DEFAULT_PORT, memory_bytes=256 * 1024 ** 2,
+          cache_dir=None, disk_bytes=2 * 1024 ** 3, rescan_seconds=10.0,
+          pixel_bytes=512 * 1024 ** 2):
+    """Serve enhanced images from folder until interrupted"""
+    server = ThreadingHTTPServer((host, port), WadoRequestHandler)
+    server.service = EnhancedImageService(folder, memory_bytes, cache_dir, disk_bytes,
+                                          rescan_seconds, pixel_bytes)
+    print(f"Serving {len(server.service.index.paths)} instances from {folder} "
+          f"on http://{host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="On-demand enhanced DICOM images over HTTP")
+    parser.add_argument("folder", help="Folder containing .dcm files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--memory-mb", type=int, default=256,
+                        help="In-memory cache of responses")
+    parser.add_argument("--pixel-memory-mb", type=int, default=512,
+                        help="In-memory cache of enhanced pixels shared by all responses of an instance")
+    parser.add_argument("--cache-dir", help="On-disk cache of enhanced pixels")
+    parser.add_argument("--cache-size-mb", type=int, default=2048,
+                        help="Evict least recently used disk cache entries above this size")
+    parser.add_argument("--rescan-seconds", type=float, default=10.0,
+                        help="Minimum time between folder rescans for unknown instances")
+    args = parser.parse_args(argv)
+
+    serve(args.folder, args.host, args.port, args.memory_mb * 1024 * 1024,
+          args.cache_dir, args.cache_size_mb * 1024 * 1024, args.rescan_seconds,
+          args.pixel_memory_mb * 1024 * 1024)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())